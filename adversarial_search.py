@@ -9,6 +9,140 @@ Your task for homework 6 is to implement:
 """
 import random
 import math  # You can use math.inf to initialize to infinity
+import collections
+import time
+import multiprocessing
+
+# Transposition table entry flags: the stored value is the exact minimax
+# value, a lower bound (the search failed high) or an upper bound (the
+# search failed low)
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+
+class TranspositionTable(object):
+    """
+    Cache of searched positions that can be shared across the recursion
+    and across successive calls to minimax, alphabeta and abdl.
+    Use a separate table for each of the three searches since they do not
+    score positions on the same scale.
+    Arguments:
+    max_entries (int): memory cap - once the table holds this many
+        positions the least recently used entry is evicted.
+
+    Attributes:
+    entries (OrderedDict): keys are (state key, agent) tuples and the
+        values are (value, flag, depth) tuples.
+    hits (int): number of lookups that found an entry
+    misses (int): number of lookups that did not find an entry
+    evictions (int): number of entries evicted to respect max_entries
+    """
+
+    def __init__(self, max_entries=1000000):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key):
+        """
+        Look up a position in the table.
+        :param key: (state key, agent) tuple
+        :return: (value, flag, depth) tuple or None if not found
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)  # most recently used
+        return entry
+
+    def store(self, key, value, flag, depth=math.inf):
+        """
+        Record the result of searching a position, evicting the least
+        recently used entry if the table is full.
+        :param key: (state key, agent) tuple
+        :param value: (number) value found by the search
+        :param flag: EXACT, LOWER or UPPER
+        :param depth: remaining search depth (math.inf for a full search)
+        :return: None
+        """
+        self.entries[key] = (value, flag, depth)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def hit_rate(self):
+        """
+        :return: (float) fraction of lookups that found an entry
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        """
+        Remove all the entries and reset the statistics.
+        :return: None
+        """
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+
+def state_key(game_state):
+    """
+    Hashable key identifying the position of the given game state.
+    :param game_state: GameState object
+    :return: the state's own key() if it provides one, otherwise a tuple
+        of the board rows
+    """
+    if hasattr(game_state, 'key'):
+        return game_state.key()
+    return tuple(map(tuple, game_state.board))
+
+
+def tt_probe(table, key, alpha, beta, depth=math.inf):
+    """
+    Use a transposition table entry to answer or narrow an alpha beta search.
+    :param table: TranspositionTable object
+    :param key: (state key, agent) tuple
+    :param depth: remaining search depth - shallower entries are ignored
+    :return: (value, alpha, beta) - value is None unless the entry
+        settles the search
+    """
+    entry = table.lookup(key)
+    if entry is None or entry[2] < depth:
+        return None, alpha, beta
+    v, flag, _ = entry
+    if flag == EXACT:
+        return v, alpha, beta
+    if flag == LOWER:
+        alpha = max(alpha, v)
+    else:
+        beta = min(beta, v)
+    if alpha >= beta:
+        return v, alpha, beta
+    return None, alpha, beta
+
+
+def tt_record(table, key, v, alpha, beta, depth=math.inf):
+    """
+    Store an alpha beta search result with the bound flag matching the
+    window (alpha, beta) it was searched with.
+    :return: None
+    """
+    if v <= alpha:
+        table.store(key, v, UPPER, depth)
+    elif v >= beta:
+        table.store(key, v, LOWER, depth)
+    else:
+        table.store(key, v, EXACT, depth)
 
 
 def rand(game_state):
@@ -27,29 +161,42 @@ def rand(game_state):
 
 # Note: The agents take turns playing.  So when an agent is in control of a state, it is the other agent who is in
 # control of the successor state.  The same agent cannot make a move and be in control of the successor state.
-def minimax(game_state):
+def minimax(game_state, table=None, book=None):
     """
     Find the best move for our AI agent using the minimax algorithm.
     (searching the entire tree from the current game state)
     :param game_state: GameState object
+    :param table: optional TranspositionTable shared across calls
+    :param book: optional tablebase.Tablebase - positions found in it are
+        not searched
     :return:  a tuple representing the row column of the best move
     """
     # Enter your code here and remove the raise statement below
+    if book is not None:
+        move = book.best_move(game_state)
+        if move is not None:
+            return move
     moveList = game_state.possible_moves()
-    return max(moveList, key=lambda move: value(game_state.successor(move, 'AI'), 'user'))
+    return max(moveList, key=lambda move: value(game_state.successor(move, 'AI'), 'user', table))
     # raise NotImplementedError
 
 
-def value(game_state, agent):
+def value(game_state, agent, table=None):
     """
     Calculate the minimax value for any state under the given agent's
     control.
     :param game_state: GameState object - state may be terminal or
     non-terminal
     :param agent: (string) 'user' or 'AI' - AI is max
+    :param table: optional TranspositionTable of exact values
     :return: (integer) value of that state -1, 0 or 1
     """
     # Enter your code here and remove the pass statement below
+    if table is not None:
+        key = (state_key(game_state), agent)
+        entry = table.lookup(key)
+        if entry is not None:
+            return entry[0]
     # if the state is a terminal state: return the state’s utility
     if game_state.is_win('user'):
         return -1
@@ -59,14 +206,17 @@ def value(game_state, agent):
         return 1
     # if the agent is MAX: return max-value(state)
     if agent == 'AI':
-        return max_value(game_state)
+        v = max_value(game_state, table)
     # if the agent is MIN: return min - value(state)
     else:
-        return min_value(game_state)
+        v = min_value(game_state, table)
+    if table is not None:
+        table.store(key, v, EXACT)
+    return v
     # pass
 
 
-def max_value(game_state):
+def max_value(game_state, table=None):
     """
     Calculate the minimax value for a non-terminal state under Max's
     control (AI agent)
@@ -75,12 +225,12 @@ def max_value(game_state):
     """
     # Enter your code here and remove the pass statement below
     moveList = game_state.possible_moves()
-    v = max(value(game_state.successor(move, 'AI'), 'user') for move in moveList)
+    v = max(value(game_state.successor(move, 'AI'), 'user', table) for move in moveList)
     return v
     # pass
 
 
-def min_value(game_state):
+def min_value(game_state, table=None):
     """
     Calculate the minimax value for a non-terminal state under Min's
     control (user)
@@ -89,33 +239,48 @@ def min_value(game_state):
     """
     # Enter your code here and remove the pass statement below
     moveList = game_state.possible_moves()
-    v = min(value(game_state.successor(move, 'user'), 'AI') for move in moveList)
+    v = min(value(game_state.successor(move, 'user'), 'AI', table) for move in moveList)
     return v
     # pass
 
 
-def alphabeta(game_state):
+def alphabeta(game_state, table=None, book=None):
     """
     Find the best move for our AI agent using the minimax algorithm
     with alpha beta pruning.
     :param game_state: GameState object
+    :param table: optional TranspositionTable shared across calls
+    :param book: optional tablebase.Tablebase - positions found in it are
+        not searched
     :return:  a tuple representing the row column of the best move
     """
     # Enter your code here and remove the raise statement below
+    if book is not None:
+        move = book.best_move(game_state)
+        if move is not None:
+            return move
     alpha = -math.inf
     beta = math.inf
+    best_move = None
     moveList = game_state.possible_moves()
-    return max(moveList, key=lambda move: ab_value(game_state.successor(move, 'AI'), 'user', alpha, beta))
+    # pass the best value found so far on to the remaining root moves:
+    # a later move only replaces the best move if its value is higher
+    for move in moveList:
+        v = ab_value(game_state.successor(move, 'AI'), 'user', alpha, beta, table)
+        if v > alpha or best_move is None:
+            alpha, best_move = v, move
+    return best_move
     # raise NotImplementedError
 
 
-def ab_value(game_state, agent, alpha, beta):
+def ab_value(game_state, agent, alpha, beta, table=None):
     """
     Calculate the minimax value for any state under the given agent's
     control using alpha beta pruning
     :param game_state: GameState object - state may be terminal or
     non-terminal.
     :param agent: (string) 'user' or 'AI' - AI is max
+    :param table: optional TranspositionTable of bounded values
     :return: (integer) value of that state -1, 0 or 1
     """
     # Enter your code here and remove the pass statement below
@@ -126,16 +291,24 @@ def ab_value(game_state, agent, alpha, beta):
         return 0
     if game_state.is_win('AI'):
         return 1
+    if table is not None:
+        key = (state_key(game_state), agent)
+        v, alpha, beta = tt_probe(table, key, alpha, beta)
+        if v is not None:
+            return v
     # if the agent is MAX: return abmax_value(state, α, β)
     if agent == 'AI':
-        return abmax_value(game_state, alpha, beta)
+        v = abmax_value(game_state, alpha, beta, table)
     # if the agent is MIN: return abmin_value(state, α, β)
     else:
-        return abmin_value(game_state, alpha, beta)
+        v = abmin_value(game_state, alpha, beta, table)
+    if table is not None:
+        tt_record(table, key, v, alpha, beta)
+    return v
     # pass
 
 
-def abmax_value(game_state, alpha, beta):
+def abmax_value(game_state, alpha, beta, table=None):
     """
     Calculate the minimax value for a non-terminal state under Max's
     control (AI agent) using alpha beta pruning
@@ -146,7 +319,7 @@ def abmax_value(game_state, alpha, beta):
     v = -math.inf
     moveList = game_state.possible_moves()
     for move in moveList:
-        v = max(v, ab_value(game_state.successor(move, 'AI'), 'user', alpha, beta))
+        v = max(v, ab_value(game_state.successor(move, 'AI'), 'user', alpha, beta, table))
         if v >= beta:
             return v
         alpha = max(alpha, v)
@@ -154,7 +327,7 @@ def abmax_value(game_state, alpha, beta):
     # pass
 
 
-def abmin_value(game_state, alpha, beta):
+def abmin_value(game_state, alpha, beta, table=None):
     """
     Calculate the minimax value for a non-terminal state under Min's
     control (user) using alpha beta pruning
@@ -165,7 +338,7 @@ def abmin_value(game_state, alpha, beta):
     v = math.inf
     moveList = game_state.possible_moves()
     for move in moveList:
-        v = min(v, ab_value(game_state.successor(move, 'user'), 'AI', alpha, beta))
+        v = min(v, ab_value(game_state.successor(move, 'user'), 'AI', alpha, beta, table))
         if v <= alpha:
             return v
         beta = min(beta, v)
@@ -173,23 +346,29 @@ def abmin_value(game_state, alpha, beta):
     # pass
 
 
-def abdl(game_state, depth):
+def abdl(game_state, depth, table=None):
     """
     Find the best move for our AI agent by limiting the alpha beta
     search the given depth and using the evaluation function
     game_state.eval()
     :param game_state: GameState object
+    :param table: optional TranspositionTable shared across calls
     :return:  a tuple representing the row column of the best move
     """
     # Enter your code here and remove the raise statement below
     alpha = -math.inf
     beta = math.inf
+    best_move = None
     moveList = game_state.possible_moves()
-    return max(moveList, key=lambda move: abdl_value(game_state.successor(move, 'AI'), 'user', alpha, beta, depth))
+    for move in moveList:
+        v = abdl_value(game_state.successor(move, 'AI'), 'user', alpha, beta, depth, table)
+        if v > alpha or best_move is None:
+            alpha, best_move = v, move
+    return best_move
     # raise NotImplementedError
 
 
-def abdl_value(game_state, agent, alpha, beta, depth):
+def abdl_value(game_state, agent, alpha, beta, depth, table=None, ordering=None):
     """
     Calculate the utility for any state under the given agent's control
     using depth limited alpha beta pruning and the evaluation
@@ -197,6 +376,9 @@ def abdl_value(game_state, agent, alpha, beta, depth):
     :param game_state: GameState object - state may be terminal or
     non-terminal
     :param agent: (string) 'user' or 'AI' - AI is max
+    :param table: optional TranspositionTable of bounded values - entries
+        searched to at least the remaining depth are reused
+    :param ordering: optional MoveOrdering used to order the moves
     :return: (integer) utility of that state
     """
     # Enter your code here and remove the pass statement below
@@ -212,16 +394,24 @@ def abdl_value(game_state, agent, alpha, beta, depth):
     # if maximum depth reached use the evaluation function
     if depth == 0:
         return game_state.eval()
+    if table is not None:
+        key = (state_key(game_state), agent)
+        v, alpha, beta = tt_probe(table, key, alpha, beta, depth)
+        if v is not None:
+            return v
     # if the agent is MAX: return abdlmax_value(state, α, β, depth)
     if agent == 'AI':
-        return abdlmax_value(game_state, alpha, beta, depth)
+        v = abdlmax_value(game_state, alpha, beta, depth, table, ordering)
     # if the agent is MIN: return abdlmin_value(state, α, β, depth)
     else:
-        return abdlmin_value(game_state, alpha, beta, depth)
+        v = abdlmin_value(game_state, alpha, beta, depth, table, ordering)
+    if table is not None:
+        tt_record(table, key, v, alpha, beta, depth)
+    return v
     # pass
 
 
-def abdlmax_value(game_state, alpha, beta, depth):
+def abdlmax_value(game_state, alpha, beta, depth, table=None, ordering=None):
     """
     Calculate the utility for a non-terminal state under Max's control
     using depth limited alpha beta pruning and the evaluation
@@ -230,10 +420,12 @@ def abdlmax_value(game_state, alpha, beta, depth):
     :return: (integer) utility (evaluation function) of that state
     """
     # Enter your code here and remove the pass statement below
+    if ordering is not None:
+        return ordered_value(game_state, 'AI', alpha, beta, depth, table, ordering)
     v = -math.inf
     moveList = game_state.possible_moves()
     for move in moveList:
-        v = max(v, abdl_value(game_state.successor(move, 'AI'), 'user', alpha, beta, depth - 1))
+        v = max(v, abdl_value(game_state.successor(move, 'AI'), 'user', alpha, beta, depth - 1, table))
         if v >= beta:
             return v
         alpha = max(alpha, v)
@@ -241,7 +433,7 @@ def abdlmax_value(game_state, alpha, beta, depth):
     # pass
 
 
-def abdlmin_value(game_state, alpha, beta, depth):
+def abdlmin_value(game_state, alpha, beta, depth, table=None, ordering=None):
     """
     Calculate the utility for a non-terminal state under Min's control
     using depth limited alpha beta pruning and the evaluation
@@ -250,12 +442,417 @@ def abdlmin_value(game_state, alpha, beta, depth):
     :return: (integer) utility (evaluation function) of that state
     """
     # Enter your code here and remove the pass statement below
+    if ordering is not None:
+        return ordered_value(game_state, 'user', alpha, beta, depth, table, ordering)
     v = math.inf
     moveList = game_state.possible_moves()
     for move in moveList:
-        v = min(v, abdl_value(game_state.successor(move, 'user'), 'AI', alpha, beta, depth - 1))
+        v = min(v, abdl_value(game_state.successor(move, 'user'), 'AI', alpha, beta, depth - 1, table))
         if v <= alpha:
             return v
         beta = min(beta, v)
     return v
     # pass
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside an iterative deepening search when the move budget runs out.
+    """
+    pass
+
+
+class MoveOrdering(object):
+    """
+    Move ordering information collected by one iteration of abdl_id and
+    used to order possible_moves() in the next, deeper iteration.
+    Moves are tried in this order:
+    1. the best move found at the position by the previous iteration
+       (the principal variation and the hash moves)
+    2. the killer moves: moves that caused a cutoff at the same ply
+    3. the remaining moves by their history score
+    Arguments:
+    deadline (float): see the deadline attribute
+    max_entries (int): memory cap on best - once it holds this many
+        positions the least recently used entry is evicted.
+
+    Attributes:
+    best (OrderedDict): keys are (state key, agent) tuples and the values
+        are the best move found at that position
+    killers (dict): keys are plies and the values are lists of (at most
+        two) moves that caused a cutoff at that ply
+    history (dict): keys are moves and the values are the sum of
+        depth ** 2 over all the cutoffs caused by that move
+    root_depth (int): depth of the current iteration - used to turn the
+        remaining depth into a ply
+    deadline (float): time.monotonic() value at which the search is
+        aborted with SearchTimeout (None for no deadline)
+    """
+
+    def __init__(self, deadline=None, max_entries=1000000):
+        self.max_entries = max_entries
+        self.best = collections.OrderedDict()
+        self.killers = {}
+        self.history = {}
+        self.root_depth = 0
+        self.deadline = deadline
+
+    def order(self, game_state, agent, depth):
+        """
+        Order the possible moves of a non-terminal state, most promising first.
+        :param game_state: non-terminal GameState object
+        :param agent: (string) 'user' or 'AI' - agent in control
+        :param depth: remaining search depth
+        :return: list of moves
+        """
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SearchTimeout
+        key = (state_key(game_state), agent)
+        best = self.best.get(key)
+        if best is not None:
+            self.best.move_to_end(key)  # most recently used
+        killers = self.killers.get(self.root_depth - depth, ())
+        history = self.history
+        # sorted is stable so moves with equal scores keep their order
+        return sorted(game_state.possible_moves(),
+                      key=lambda move: (move == best, move in killers, history.get(move, 0)),
+                      reverse=True)
+
+    def record(self, game_state, agent, move, depth, cutoff):
+        """
+        Remember the best move found at a position (evicting the least
+        recently used position if best is full) and, if it caused a cutoff,
+        make it a killer move and raise its history score.
+        :return: None
+        """
+        key = (state_key(game_state), agent)
+        self.best[key] = move
+        self.best.move_to_end(key)
+        if len(self.best) > self.max_entries:
+            self.best.popitem(last=False)
+        if cutoff:
+            killers = self.killers.setdefault(self.root_depth - depth, [])
+            if move not in killers:
+                killers.insert(0, move)
+                del killers[2:]
+            self.history[move] = self.history.get(move, 0) + depth * depth
+
+
+def ordered_value(game_state, agent, alpha, beta, depth, table, ordering):
+    """
+    Calculate the utility for a non-terminal state like abdlmax_value and
+    abdlmin_value, trying the moves in the order given by ordering and
+    recording the best move (and any cutoff) back into it.
+    :param game_state: non-terminal GameState object
+    :param agent: (string) 'user' or 'AI' - AI is max
+    :return: (integer) utility (evaluation function) of that state
+    """
+    other = 'user' if agent == 'AI' else 'AI'
+    v = -math.inf if agent == 'AI' else math.inf
+    best = None
+    for move in ordering.order(game_state, agent, depth):
+        child = abdl_value(game_state.successor(move, agent), other, alpha, beta, depth - 1, table, ordering)
+        if agent == 'AI':
+            if child > v or best is None:
+                v, best = child, move
+            if v >= beta:
+                ordering.record(game_state, agent, move, depth, True)
+                return v
+            alpha = max(alpha, v)
+        else:
+            if child < v or best is None:
+                v, best = child, move
+            if v <= alpha:
+                ordering.record(game_state, agent, move, depth, True)
+                return v
+            beta = min(beta, v)
+    ordering.record(game_state, agent, best, depth, False)
+    return v
+
+
+def abdl_id(game_state, time_limit, max_depth=None, table=None, ordering=None):
+    """
+    Find the best move for our AI agent with iterative deepening: search
+    with abdl one ply deeper at a time until the time budget runs out.
+    Each iteration orders the moves using the principal variation,
+    killer moves and history collected by the previous ones.
+    :param game_state: GameState object
+    :param time_limit: (float) seconds available for the move
+    :param max_depth: optional deepest search depth (by default the
+        search stops once it reaches the end of the game)
+    :param table: optional TranspositionTable shared across calls
+    :param ordering: optional MoveOrdering shared across calls
+    :return:  a tuple representing the row column of the best move
+        found by the last completed iteration
+    """
+    if ordering is None:
+        ordering = MoveOrdering()
+    ordering.deadline = time.monotonic() + time_limit
+    moveList = game_state.possible_moves()
+    best_move = moveList[0]
+    # the children of the root have len(moveList) - 1 empty squares left
+    if max_depth is None:
+        max_depth = len(moveList) - 1
+    try:
+        for depth in range(min(max_depth, len(moveList) - 1) + 1):
+            ordering.root_depth = depth
+            best_move = ordered_root(game_state, depth, table, ordering)
+    except SearchTimeout:
+        pass  # keep the move from the last completed iteration
+    return best_move
+
+
+def ordered_root(game_state, depth, table, ordering):
+    """
+    Search the root moves in the order given by ordering, passing the best
+    value found so far on to the remaining moves as alpha.
+    :return:  a tuple representing the row column of the best move
+    """
+    alpha = -math.inf
+    best_move = None
+    for move in ordering.order(game_state, 'AI', depth + 1):
+        v = abdl_value(game_state.successor(move, 'AI'), 'user', alpha, math.inf, depth, table, ordering)
+        if v > alpha or best_move is None:
+            alpha, best_move = v, move
+    ordering.record(game_state, 'AI', best_move, depth + 1, False)
+    return best_move
+
+
+# Best root (value, move index) found so far - shared between the worker
+# processes of a parallel root search
+root_best = None
+
+
+def init_root_worker(shared):
+    """
+    Process pool initializer: make the shared root best visible to the worker.
+    :return: None
+    """
+    global root_best
+    root_best = shared
+
+
+def root_worker(task):
+    """
+    Search a single root move in a worker process. The move is searched
+    with the best value found so far by any worker as alpha. Moves that
+    come before the current best move must also win ties, so their alpha
+    is lowered just below that value.
+    :param task: (game_state, index, move, depth) tuple - depth is None
+        for a full alpha beta search
+    :return: (index, value) tuple - value is exact if it is greater than
+        the alpha the move was searched with
+    """
+    game_state, index, move, depth = task
+    with root_best.get_lock():
+        alpha, best_index = root_best[0], root_best[1]
+    if index < best_index:
+        alpha = math.nextafter(alpha, -math.inf)
+    child = game_state.successor(move, 'AI')
+    if depth is None:
+        v = ab_value(child, 'user', alpha, math.inf)
+    else:
+        v = abdl_value(child, 'user', alpha, math.inf, depth)
+    if v > alpha:
+        with root_best.get_lock():
+            if v > root_best[0] or (v == root_best[0] and index < root_best[1]):
+                root_best[0], root_best[1] = v, index
+    return index, v
+
+
+def parallel_root(game_state, depth=None, workers=None):
+    """
+    Split the root moves of an alpha beta search over a process pool
+    (young brothers wait: the first move is searched on its own to get a
+    good alpha, the remaining moves are then searched in parallel).
+    Returns the same move as the serial search: the first move with the
+    highest value.
+    :param game_state: GameState object
+    :param depth: depth limit as in abdl (None for a full search as in
+        alphabeta)
+    :param workers: number of worker processes (default: CPU count)
+    :return:  a tuple representing the row column of the best move
+    """
+    moveList = game_state.possible_moves()
+    first = game_state.successor(moveList[0], 'AI')
+    if depth is None:
+        v = ab_value(first, 'user', -math.inf, math.inf)
+    else:
+        v = abdl_value(first, 'user', -math.inf, math.inf, depth)
+    if len(moveList) == 1:
+        return moveList[0]
+    shared = multiprocessing.Array('d', [v, 0])
+    tasks = [(game_state, index, move, depth) for index, move in enumerate(moveList) if index > 0]
+    with multiprocessing.Pool(workers, init_root_worker, (shared,)) as pool:
+        results = [(0, v)] + pool.map(root_worker, tasks, chunksize=1)
+    # values of moves that failed low never beat the best exact value
+    best_index, best_value = max(results, key=lambda result: (result[1], -result[0]))
+    return moveList[best_index]
+
+
+def alphabeta_parallel(game_state, workers=None):
+    """
+    Find the best move for our AI agent using alpha beta pruning with the
+    root moves searched in parallel.
+    :param game_state: GameState object
+    :param workers: number of worker processes (default: CPU count)
+    :return:  a tuple representing the row column of the best move
+    """
+    return parallel_root(game_state, None, workers)
+
+
+def abdl_parallel(game_state, depth, workers=None):
+    """
+    Find the best move for our AI agent using depth limited alpha beta
+    pruning with the root moves searched in parallel.
+    :param game_state: GameState object
+    :param workers: number of worker processes (default: CPU count)
+    :return:  a tuple representing the row column of the best move
+    """
+    return parallel_root(game_state, depth, workers)
+
+
+def benchmark_parallel(game_state, depth=None, max_workers=None):
+    """
+    Time the parallel root search with 1..max_workers processes against
+    the serial search and check that they all pick the same move.
+    :param game_state: GameState object
+    :param depth: depth limit as in abdl (None for a full search as in
+        alphabeta)
+    :param max_workers: largest number of workers (default: CPU count)
+    :return: dictionary - keys are the number of workers (0 for the
+        serial search) and the values are the times in seconds
+    """
+    max_workers = max_workers or multiprocessing.cpu_count()
+    start = time.perf_counter()
+    serial_move = alphabeta(game_state) if depth is None else abdl(game_state, depth)
+    times = {0: time.perf_counter() - start}
+    print('serial: move', serial_move, 'time %.3fs' % times[0])
+    for workers in range(1, max_workers + 1):
+        start = time.perf_counter()
+        move = parallel_root(game_state, depth, workers)
+        times[workers] = time.perf_counter() - start
+        assert move == serial_move, (move, serial_move)
+        print('workers: %d time %.3fs speedup %.2f' % (workers, times[workers], times[0] / times[workers]))
+    return times
+
+
+def pvs(game_state, depth=None):
+    """
+    Find the best move for our AI agent using the negamax principal
+    variation search engine: the first root move is searched with the
+    full window and the remaining ones with a null window around the
+    best value so far, re-searching only the moves that beat it.
+    Returns the same move as alphabeta (depth None) or abdl.
+    :param game_state: GameState object
+    :param depth: depth limit as in abdl (None for a full search)
+    :return:  a tuple representing the row column of the best move
+    """
+    alpha = -math.inf
+    best_move = None
+    for move in game_state.possible_moves():
+        child = game_state.successor(move, 'AI')
+        if best_move is None:
+            v = -negamax_value(child, 'user', -math.inf, math.inf, depth)
+        else:
+            v = -negamax_value(child, 'user', -alpha - 1, -alpha, depth)
+            if v > alpha:
+                v = -negamax_value(child, 'user', -math.inf, -alpha, depth)
+        if v > alpha or best_move is None:
+            alpha, best_move = v, move
+    return best_move
+
+
+def negamax_value(game_state, agent, alpha, beta, depth=None):
+    """
+    Calculate the value of any state from the point of view of the agent
+    in control, using negamax with principal variation (null window)
+    search. This single function replaces the max/min pairs: the value of
+    a state for one agent is minus its value for the other.
+    Scores must be integers (as returned by game_state.eval()) so that
+    (alpha, alpha + 1) is a null window.
+    :param game_state: GameState object - state may be terminal or
+    non-terminal
+    :param agent: (string) 'user' or 'AI' - agent in control
+    :param depth: remaining depth as in abdl_value (None for a full
+        search scored -1, 0 or 1 as in ab_value)
+    :return: (integer) value of that state for agent
+    """
+    sign = 1 if agent == 'AI' else -1
+    x = 1 if depth is None else game_state.size * 2 + 2
+    if game_state.is_win('user'):
+        return -x * sign
+    if game_state.is_tie():
+        return 0
+    if game_state.is_win('AI'):
+        return x * sign
+    if depth == 0:
+        return game_state.eval() * sign
+    other = 'user' if agent == 'AI' else 'AI'
+    next_depth = None if depth is None else depth - 1
+    v = -math.inf
+    for move in game_state.possible_moves():
+        child = game_state.successor(move, agent)
+        if v == -math.inf:
+            score = -negamax_value(child, other, -beta, -alpha, next_depth)
+        else:
+            score = -negamax_value(child, other, -alpha - 1, -alpha, next_depth)
+            if alpha < score < beta:
+                score = -negamax_value(child, other, -beta, -score, next_depth)
+        v = max(v, score)
+        alpha = max(alpha, v)
+        if alpha >= beta:
+            break
+    return v
+
+
+class CountingState(object):
+    """
+    Wrap a GameState to count the states a search generates through
+    successor(). Every other attribute is read from the wrapped state.
+    Arguments:
+    game_state (GameState): the state to wrap
+    counter (list): one element list shared by the state and all its
+        successors (a new counter is created if not given)
+    """
+
+    def __init__(self, game_state, counter=None):
+        self.game_state = game_state
+        self.counter = [0] if counter is None else counter
+
+    def successor(self, move, agent):
+        self.counter[0] += 1
+        return CountingState(self.game_state.successor(move, agent), self.counter)
+
+    def __getattr__(self, name):
+        return getattr(self.game_state, name)
+
+
+def compare_node_counts(game_state, depth=None):
+    """
+    Count the nodes searched for the same move by the original alpha beta
+    root (every root move searched with the full window), alphabeta/abdl
+    with the root window passed on, and pvs.
+    :param game_state: GameState object
+    :param depth: depth limit as in abdl (None for a full search)
+    :return: dictionary - keys are the search names and the values are
+        (move, nodes) tuples
+    """
+    def full_window_root(state):
+        if depth is None:
+            return max(state.possible_moves(),
+                       key=lambda move: ab_value(state.successor(move, 'AI'), 'user', -math.inf, math.inf))
+        return max(state.possible_moves(),
+                   key=lambda move: abdl_value(state.successor(move, 'AI'), 'user', -math.inf, math.inf, depth))
+
+    searches = {'full window root': full_window_root,
+                'alphabeta' if depth is None else 'abdl':
+                    alphabeta if depth is None else lambda state: abdl(state, depth),
+                'pvs': lambda state: pvs(state, depth)}
+    counts = {}
+    for name, search in searches.items():
+        state = CountingState(game_state)
+        move = search(state)
+        counts[name] = (move, state.counter[0])
+        print('%s: move %s nodes %d' % (name, move, state.counter[0]))
+    return counts
@@ -6,6 +6,13 @@ Your task for homework 8 is to implement:
 1.  update
 2.  recommend_sensing
 """
+import collections
+import collections.abc
+import math
+import time
+
+import numpy as np
+
 import utils
 
 class Belief(object):
@@ -17,7 +24,7 @@ class Belief(object):
     size (int): the number of rows/columns in the grid
 
     Attributes:
-    open (list of tuples): list containing all the positions that have not
+    open (set of tuples): set containing all the positions that have not
         been observed so far.
     current_distribution (dictionary): probability distribution based on
         the evidence observed so far.
@@ -29,10 +36,11 @@ class Belief(object):
 
     def __init__(self, size):
         # Initially all positions are open - have not been observed
-        self.open = [(x, y) for x in range(size)
+        positions = [(x, y) for x in range(size)
                      for y in range(size)]
+        self.open = set(positions)
         # Initialize to a uniform distribution
-        self.current_distribution = {pos: 1 / (size ** 2) for pos in self.open}
+        self.current_distribution = {pos: 1 / (size ** 2) for pos in positions}
 
 
     def update(self, color, sensor_position, model):
@@ -70,8 +78,39 @@ class Belief(object):
         # print("should add up to be 1:", sum(self.current_distribution.values()))
 
         # Update self.open since sensor_position has now been observed
-        if sensor_position in self.open:
-            self.open.remove(sensor_position)
+        self.open.discard(sensor_position)
+
+    def update_many(self, observations, model):
+        """
+        Update the belief distribution based on a batch of evidence, with
+        the same result as calling update for each observation in turn.
+        The log-likelihoods of all the observations are added up and the
+        distribution is normalized once, so long batches do not underflow.
+        :param observations: list of (color, sensor_position) tuples
+        :param model (Model object) models the relationship between the
+             treasure location and the sensor data
+        :return: None
+        """
+        log_probs = {pos: math.log(prob) if prob > 0 else -math.inf
+                     for pos, prob in self.current_distribution.items()}
+        # identical observations only need their log-likelihood computed once
+        counts = collections.Counter(observations)
+        for (color, sensor_position), count in counts.items():
+            for pos in log_probs:
+                pct = model.pcolorgivendist(color, utils.manhattan_distance(pos, sensor_position))
+                log_probs[pos] += count * math.log(pct) if pct > 0 else -math.inf
+        # normalize relative to the largest log probability - the belief is
+        # only changed once the whole batch is known to be valid
+        max_log_prob = max(log_probs.values())
+        if max_log_prob == -math.inf:
+            raise ValueError('the observations have probability 0 under the current distribution')
+        for pos in log_probs:
+            self.current_distribution[pos] = math.exp(log_probs[pos] - max_log_prob)
+        sum_of_probs = sum(self.current_distribution.values())
+        for pos in self.current_distribution:
+            self.current_distribution[pos] /= sum_of_probs
+        for _, sensor_position in counts:
+            self.open.discard(sensor_position)
 
     def recommend_sensing(self):
         """
@@ -87,28 +126,706 @@ class Belief(object):
             the next measurement
         """
         # Enter your code and remove the statement below
-        # Highest probability in observed positions
-        observed_probs = {}
-        for pos in self.current_distribution:
-            if pos not in self.open:
-                observed_probs[pos] = self.current_distribution[pos]
-
-        max_observed = max(observed_probs, key=lambda pos: observed_probs[pos])
-
-        # Highest probability in unobserved position
-        unobserved_probs = {}
-        if len(self.open) > 0:
-            for pos in self.open:
-                unobserved_probs[pos] = self.current_distribution[pos]
-            max_unobserved = max(unobserved_probs, key=lambda pos: unobserved_probs[pos])
+        # Highest probability in observed and in unobserved positions, in
+        # a single pass over the grid (first position wins ties)
+        max_observed = max_unobserved = None
+        for pos, prob in self.current_distribution.items():
+            if pos in self.open:
+                if max_unobserved is None or prob > self.current_distribution[max_unobserved]:
+                    max_unobserved = pos
+            elif max_observed is None or prob > self.current_distribution[max_observed]:
+                max_observed = pos
 
         if len(self.open) > 0:  # if there ARE remaining unobserved locations
             # if all remaining unobserved locations have a probability of 0,
             # return the unobserved location that is closest to the location
             # with the highest probability
-            if all(probs == 0 for probs in unobserved_probs.values()):
-                return utils.closest_point(max_observed, self.open)
+            if self.current_distribution[max_unobserved] == 0:
+                return utils.closest_point(max_observed, sorted(self.open))
             else:  # the most promising unobserved location
                 return max_unobserved
         else:  # no remaining unobserved locations, return the location with the highest probability
             return max_observed
+
+
+class DistributionView(collections.abc.Mapping):
+    """
+    Dictionary view of a 2-D probability array: the keys are the grid
+    positions (x, y) in the same order as Belief.current_distribution and
+    the values are read from (and written to) array[x, y].
+    """
+
+    def __init__(self, array):
+        self.array = array
+
+    def __getitem__(self, pos):
+        rows, cols = self.array.shape
+        try:
+            x, y = pos
+            inside = 0 <= x < rows and 0 <= y < cols and x == int(x) and y == int(y)
+        except (TypeError, ValueError):
+            raise KeyError(pos)
+        if not inside:
+            raise KeyError(pos)
+        return float(self.array[int(x), int(y)])
+
+    def __setitem__(self, pos, value):
+        self.array[pos] = value
+
+    def __iter__(self):
+        rows, cols = self.array.shape
+        return ((x, y) for x in range(rows) for y in range(cols))
+
+    def __len__(self):
+        return self.array.size
+
+
+class OpenView(collections.abc.Set):
+    """
+    Set view of the unobserved positions, backed by the boolean observed
+    array: membership reads a single entry of the array and iteration is
+    lazy, in row order.
+    """
+
+    def __init__(self, observed):
+        self.observed = observed
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return set(iterable)
+
+    def __contains__(self, pos):
+        rows, cols = self.observed.shape
+        try:
+            x, y = pos
+            inside = 0 <= x < rows and 0 <= y < cols and x == int(x) and y == int(y)
+        except (TypeError, ValueError):
+            return False
+        return inside and not self.observed[int(x), int(y)]
+
+    def __iter__(self):
+        return (tuple(pos) for pos in np.argwhere(~self.observed).tolist())
+
+    def __len__(self):
+        return self.observed.size - int(np.count_nonzero(self.observed))
+
+
+class VectorBelief(Belief):
+    """
+    Belief that keeps the distribution in a 2-D NumPy array so an update
+    is a handful of vectorized operations instead of a loop over the grid.
+    Arguments:
+    size (int): the number of rows/columns in the grid
+
+    Attributes:
+    observed (numpy array): size x size boolean array - observed[x, y] is
+        True once position (x, y) has been observed
+    open (OpenView): set view of all the positions that have not been
+        observed so far (backed by observed)
+    distribution (numpy array): size x size array - distribution[x, y] is
+        the probability that the treasure is found at position (x, y)
+    current_distribution (DistributionView): dictionary view of
+        distribution, as in Belief
+    axis_distances (numpy array): size x size array - axis_distances[i, j]
+        is abs(i - j), so the Manhattan distance grid to a sensor at
+        (x, y) is axis_distances[x][:, None] + axis_distances[y][None, :]
+    likelihoods (dictionary): keys are colors and the values are arrays
+        indexed by distance of model.pcolorgivendist(color, distance)
+    """
+
+    def __init__(self, size):
+        self.size = size
+        # Initially all positions are open - have not been observed
+        self.observed = np.zeros((size, size), dtype=bool)
+        # Initialize to a uniform distribution
+        self.distribution = np.full((size, size), 1 / (size ** 2))
+        coordinates = np.arange(size)
+        self.axis_distances = np.abs(coordinates[:, None] - coordinates[None, :])
+        self.likelihoods = {}
+        self.model = None
+
+    @property
+    def current_distribution(self):
+        return DistributionView(self.distribution)
+
+    @property
+    def open(self):
+        return OpenView(self.observed)
+
+    def distance_grid(self, sensor_position):
+        """
+        :param sensor_position: (tuple) position of the sensor
+        :return: size x size array of the Manhattan distances from every
+            grid position to sensor_position
+        """
+        x, y = sensor_position
+        return self.axis_distances[x][:, None] + self.axis_distances[y][None, :]
+
+    def likelihood(self, color, model):
+        """
+        :param color: (string) color detected
+        :param model: (Model object) sensor model
+        :return: array indexed by distance of the probability of detecting
+            color at that distance from the treasure
+        """
+        if model is not self.model:
+            self.likelihoods = {}
+            self.model = model
+        table = self.likelihoods.get(color)
+        if table is None:
+            table = np.array([model.pcolorgivendist(color, distance)
+                              for distance in range(2 * self.size - 1)], dtype=float)
+            self.likelihoods[color] = table
+        return table
+
+    def update(self, color, sensor_position, model):
+        """
+        Update the belief distribution based on new evidence:  our agent
+        detected the given color at sensor location: sensor_position.
+        :param color: (string) color detected
+        :param sensor_position: (tuple) position of the sensor
+        :param model (Model object) models the relationship between the
+             treasure location and the sensor data
+        :return: None
+        """
+        # P(C|T) for every position: look the distance grid up in the
+        # likelihood table of the color
+        self.distribution *= self.likelihood(color, model)[self.distance_grid(sensor_position)]
+        self.distribution /= self.distribution.sum()
+
+        # sensor_position has now been observed
+        self.observed[sensor_position] = True
+
+    def update_many(self, observations, model):
+        """
+        Update the belief distribution based on a batch of evidence, as in
+        Belief.update_many, adding log-likelihood grids and normalizing once.
+        :param observations: list of (color, sensor_position) tuples
+        :param model (Model object) models the relationship between the
+             treasure location and the sensor data
+        :return: None
+        """
+        counts = collections.Counter(observations)
+        with np.errstate(divide='ignore'):
+            log_probs = np.log(self.distribution)
+            log_likelihoods = {}
+            for (color, sensor_position), count in counts.items():
+                if color not in log_likelihoods:
+                    log_likelihoods[color] = np.log(self.likelihood(color, model))
+                log_probs += count * log_likelihoods[color][self.distance_grid(sensor_position)]
+        # the belief is only changed once the whole batch is known to be valid
+        max_log_prob = log_probs.max()
+        if max_log_prob == -np.inf:
+            raise ValueError('the observations have probability 0 under the current distribution')
+        np.exp(log_probs - max_log_prob, out=self.distribution)
+        self.distribution /= self.distribution.sum()
+        for _, sensor_position in counts:
+            self.observed[sensor_position] = True
+
+    def closest_open(self, position):
+        """
+        :param position: (tuple) grid position
+        :return: the unobserved position closest to position (Manhattan
+            distance, first position in row order on ties)
+        """
+        distances = np.where(self.observed, np.iinfo(np.int64).max, self.distance_grid(position))
+        return np.unravel_index(np.argmin(distances), distances.shape)
+
+    def recommend_sensing(self):
+        """
+        Recommend where we should take the next measurement in the grid,
+        as in Belief.recommend_sensing, with masked argmax queries over
+        the distribution array.
+        :return: tuple representing the position where we should take
+            the next measurement
+        """
+        shape = self.distribution.shape
+        if self.observed.all():  # no remaining unobserved locations
+            return tuple(int(i) for i in np.unravel_index(np.argmax(self.distribution), shape))
+        unobserved = np.where(self.observed, -1.0, self.distribution)
+        best = np.argmax(unobserved)
+        if unobserved.flat[best] > 0:  # the most promising unobserved location
+            return tuple(int(i) for i in np.unravel_index(best, shape))
+        # all remaining unobserved locations have a probability of 0
+        observed = np.where(self.observed, self.distribution, -1.0)
+        max_observed = np.unravel_index(np.argmax(observed), shape)
+        return tuple(int(i) for i in self.closest_open(max_observed))
+
+    def entropy_tables(self, model, colors):
+        """
+        :param model: (Model object) sensor model
+        :param colors: (list of strings) all the colors the sensor can detect
+        :return: (likelihoods, llogl) - colors x distances arrays of
+            P(c|d) and P(c|d) log P(c|d)
+        """
+        likelihoods = np.stack([self.likelihood(color, model) for color in colors])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            llogl = np.where(likelihoods > 0, likelihoods * np.log(likelihoods), 0.0)
+        return likelihoods, llogl
+
+    def ring_prefix(self, values):
+        """
+        Prefix sums of a grid in rotated coordinates u = x + y and
+        v = x - y + size - 1, where the positions within Manhattan distance
+        d of a sensor form the square |u - u0| <= d, |v - v0| <= d.
+        :param values: size x size array
+        :return: (2 size) x (2 size) array - prefix[i, j] is the sum of the
+            rotated grid over u < i and v < j
+        """
+        size = self.size
+        rotated = np.zeros((2 * size - 1, 2 * size - 1))
+        xs, ys = np.indices((size, size))
+        rotated[xs + ys, xs - ys + size - 1] = values
+        prefix = np.zeros((2 * size, 2 * size))
+        prefix[1:, 1:] = rotated.cumsum(axis=0).cumsum(axis=1)
+        return prefix
+
+    def ring_mass(self, prefix, xs, ys):
+        """
+        :param prefix: array returned by ring_prefix
+        :param xs, ys: (numpy arrays) sensor positions
+        :return: sensors x distances array - the sum of the values at each
+            Manhattan distance from each sensor
+        """
+        size = self.size
+        distances = np.arange(2 * size - 1)
+        us = (xs + ys)[:, None]
+        vs = (xs - ys + size - 1)[:, None]
+        u_low = np.clip(us - distances, 0, 2 * size - 1)
+        u_high = np.clip(us + distances + 1, 0, 2 * size - 1)
+        v_low = np.clip(vs - distances, 0, 2 * size - 1)
+        v_high = np.clip(vs + distances + 1, 0, 2 * size - 1)
+        within = prefix[u_high, v_high] - prefix[u_low, v_high] - prefix[u_high, v_low] + prefix[u_low, v_low]
+        return np.diff(within, axis=1, prepend=0.0)
+
+    def recommend_sensing_infogain(self, model, colors, top_k=None, memory=2 ** 27):
+        """
+        Recommend the unobserved position where a measurement is expected
+        to reduce the entropy of the distribution the most.
+        For a sensor at s the expected posterior entropy is
+            sum over colors c of (Z log Z - S)
+        where Z = sum_t P(t) P(c|d(t,s)) and
+              S = sum_t P(t) P(c|d(t,s)) (log P(t) + log P(c|d(t,s))).
+        Both only depend on the probability mass (and the P log P mass) at
+        each distance from s. Those are read from prefix sums in rotated
+        coordinates (see ring_prefix) in O(size) per candidate, a batch of
+        candidates at a time.
+        :param model: (Model object) sensor model
+        :param colors: (list of strings) all the colors the sensor can detect
+        :param top_k: only evaluate the top_k most likely unobserved
+            positions (None to evaluate all of them)
+        :param memory: bytes available for the arrays of one batch
+        :return: tuple representing the position where we should take
+            the next measurement
+        """
+        if self.observed.all():
+            return self.recommend_sensing()
+        p = self.distribution
+        candidates = np.flatnonzero(~self.observed.ravel())
+        if top_k is not None and top_k < len(candidates):
+            best = np.argpartition(-p.ravel()[candidates], top_k - 1)[:top_k]
+            candidates = np.sort(candidates[best])
+        likelihoods, llogl = self.entropy_tables(model, colors)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            plogp = np.where(p > 0, p * np.log(p), 0.0)
+        prefix, prefix_plogp = self.ring_prefix(p), self.ring_prefix(plogp)
+        # about a dozen candidates x distances arrays live at once
+        batch_size = max(1, memory // (8 * 12 * (2 * self.size - 1)))
+        entropies = np.empty(len(candidates))
+        for start in range(0, len(candidates), batch_size):
+            xs, ys = np.divmod(candidates[start:start + batch_size], self.size)
+            entropies[start:start + batch_size] = expected_entropy(
+                self.ring_mass(prefix, xs, ys), self.ring_mass(prefix_plogp, xs, ys), likelihoods, llogl)
+        best = candidates[np.argmin(entropies)]
+        return tuple(int(i) for i in divmod(best, self.size))
+
+
+def expected_entropy(mass, mass_plogp, likelihoods, llogl):
+    """
+    Expected posterior entropy of sensing at each candidate position (see
+    VectorBelief.recommend_sensing_infogain).
+    :param mass: candidates x distances array of the probability mass at
+        each distance from the candidate
+    :param mass_plogp: same for P log P
+    :param likelihoods: colors x distances array of P(c|d)
+    :param llogl: colors x distances array of P(c|d) log P(c|d)
+    :return: array of the expected entropy of each candidate
+    """
+    z = mass @ likelihoods.T  # P(color | sensor) - candidates x colors
+    s = mass_plogp @ likelihoods.T + mass @ llogl.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        zlogz = np.where(z > 0, z * np.log(z), 0.0)
+    return (zlogz - s).sum(axis=1)
+
+
+class SparseView(collections.abc.Mapping):
+    """
+    Dictionary view of a sparse distribution: the keys are all the grid
+    positions (x, y) in row order and the values are 0 outside the support.
+    """
+
+    def __init__(self, size, index, probs):
+        self.size = size
+        self.index = index
+        self.probs = probs
+
+    def __getitem__(self, pos):
+        try:
+            x, y = pos
+            inside = 0 <= x < self.size and 0 <= y < self.size and x == int(x) and y == int(y)
+        except (TypeError, ValueError):
+            raise KeyError(pos)
+        if not inside:
+            raise KeyError(pos)
+        i = self.index.get((int(x), int(y)))
+        return 0.0 if i is None else float(self.probs[i])
+
+    def __iter__(self):
+        return ((x, y) for x in range(self.size) for y in range(self.size))
+
+    def __len__(self):
+        return self.size ** 2
+
+
+class SparseOpenView(collections.abc.Set):
+    """
+    Set view of the unobserved positions of a size x size grid, backed by
+    the set of observed positions: membership and length do not depend on
+    the size of the grid and iteration is lazy.
+    """
+
+    def __init__(self, size, observed_positions):
+        self.size = size
+        self.observed_positions = observed_positions
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return set(iterable)
+
+    def __contains__(self, pos):
+        try:
+            x, y = pos
+            inside = 0 <= x < self.size and 0 <= y < self.size
+        except (TypeError, ValueError):
+            return False
+        return inside and (x, y) not in self.observed_positions
+
+    def __iter__(self):
+        return ((x, y) for x in range(self.size) for y in range(self.size)
+                if (x, y) not in self.observed_positions)
+
+    def __len__(self):
+        return self.size ** 2 - len(self.observed_positions)
+
+
+class SparseBelief(VectorBelief):
+    """
+    VectorBelief for very large grids that switches to a sparse mode once
+    most of the grid has (almost) zero probability: positions whose
+    probability drops below epsilon are pruned and updates only touch the
+    remaining support.
+    Arguments:
+    size (int): the number of rows/columns in the grid
+    epsilon (float): probabilities below epsilon are set to 0 in sparse mode
+    dense_fraction (float): switch to sparse mode once at most this
+        fraction of the grid has a probability of at least epsilon
+
+    Attributes:
+    sparse (bool): True in sparse mode
+    xs, ys (numpy arrays): positions of the support in row order (sparse
+        mode only)
+    probs (numpy array): probabilities of the support (sparse mode only)
+    index (dictionary): keys are the support positions and the values are
+        their index in xs, ys and probs (sparse mode only)
+    observed_positions (set of tuples): the observed positions (sparse
+        mode only - distribution and observed are dropped)
+    """
+
+    def __init__(self, size, epsilon=1e-12, dense_fraction=0.1):
+        super().__init__(size)
+        self.epsilon = epsilon
+        self.dense_fraction = dense_fraction
+        self.sparse = False
+        self.xs = self.ys = self.probs = None
+        self.index = None
+        self.observed_positions = None
+
+    @property
+    def support_size(self):
+        """
+        :return: (int) number of positions with a non-zero probability
+        """
+        if self.sparse:
+            return len(self.probs)
+        return int(np.count_nonzero(self.distribution))
+
+    @property
+    def current_distribution(self):
+        if self.sparse:
+            return SparseView(self.size, self.index, self.probs)
+        return DistributionView(self.distribution)
+
+    @property
+    def open(self):
+        if self.sparse:
+            return SparseOpenView(self.size, self.observed_positions)
+        return super().open
+
+    def sparsify(self):
+        """
+        Switch to sparse mode if the support of the distribution is small enough.
+        :return: None
+        """
+        live = self.distribution >= self.epsilon
+        if np.count_nonzero(live) > self.dense_fraction * self.size ** 2:
+            return
+        self.xs, self.ys = np.nonzero(live)
+        self.probs = self.distribution[self.xs, self.ys]
+        self.probs /= self.probs.sum()
+        self.index = {(int(x), int(y)): i for i, (x, y) in enumerate(zip(self.xs, self.ys))}
+        self.observed_positions = set(map(tuple, np.argwhere(self.observed).tolist()))
+        self.distribution = self.observed = None
+        self.sparse = True
+
+    def prune(self):
+        """
+        Normalize the support probabilities and drop those below epsilon.
+        :return: None
+        """
+        total = self.probs.sum()
+        if total == 0:
+            raise ValueError('the observations have probability 0 under the current distribution')
+        self.probs /= total
+        live = self.probs >= self.epsilon
+        if not live.all():
+            self.xs, self.ys, self.probs = self.xs[live], self.ys[live], self.probs[live]
+            self.probs /= self.probs.sum()
+            self.index = {(int(x), int(y)): i for i, (x, y) in enumerate(zip(self.xs, self.ys))}
+
+    def support_distances(self, sensor_position):
+        """
+        :return: array of the Manhattan distances from the support positions
+            to sensor_position
+        """
+        x, y = sensor_position
+        return np.abs(self.xs - x) + np.abs(self.ys - y)
+
+    def update(self, color, sensor_position, model):
+        """
+        Update the belief distribution based on new evidence, as in
+        VectorBelief.update, touching only the support in sparse mode.
+        :return: None
+        """
+        if not self.sparse:
+            super().update(color, sensor_position, model)
+            self.sparsify()
+            return
+        self.probs *= self.likelihood(color, model)[self.support_distances(sensor_position)]
+        self.prune()
+        self.observed_positions.add(tuple(sensor_position))
+
+    def update_many(self, observations, model):
+        """
+        Update the belief distribution based on a batch of evidence, as in
+        VectorBelief.update_many, touching only the support in sparse mode.
+        :return: None
+        """
+        if not self.sparse:
+            super().update_many(observations, model)
+            self.sparsify()
+            return
+        counts = collections.Counter(observations)
+        with np.errstate(divide='ignore'):
+            log_probs = np.log(self.probs)
+            for (color, sensor_position), count in counts.items():
+                log_probs += count * np.log(self.likelihood(color, model))[self.support_distances(sensor_position)]
+        # the belief is only changed once the whole batch is known to be valid
+        max_log_prob = log_probs.max()
+        if max_log_prob == -np.inf:
+            raise ValueError('the observations have probability 0 under the current distribution')
+        self.probs = np.exp(log_probs - max_log_prob)
+        self.prune()
+        for _, sensor_position in counts:
+            self.observed_positions.add(tuple(sensor_position))
+
+    def closest_open(self, position):
+        """
+        :param position: (tuple) grid position
+        :return: the unobserved position closest to position (Manhattan
+            distance, first position in row order on ties), searching
+            outwards one distance at a time in sparse mode
+        """
+        if not self.sparse:
+            return super().closest_open(position)
+        x0, y0 = position
+        for distance in range(2 * self.size - 1):
+            ring = set()
+            for dx in range(-distance, distance + 1):
+                dy = distance - abs(dx)
+                ring.add((x0 + dx, y0 + dy))
+                ring.add((x0 + dx, y0 - dy))
+            for pos in sorted(ring):
+                if (0 <= pos[0] < self.size and 0 <= pos[1] < self.size and
+                        pos not in self.observed_positions):
+                    return pos
+        return None
+
+    def recommend_sensing(self):
+        """
+        Recommend where we should take the next measurement in the grid,
+        as in Belief.recommend_sensing, looking only at the support in
+        sparse mode.
+        :return: tuple representing the position where we should take
+            the next measurement
+        """
+        if not self.sparse:
+            return super().recommend_sensing()
+        codes = self.xs * self.size + self.ys
+        observed_codes = np.array([x * self.size + y for x, y in self.observed_positions], dtype=codes.dtype)
+        unobserved = ~np.isin(codes, observed_codes)
+        if unobserved.any():  # the most promising unobserved location in the support
+            candidates = np.flatnonzero(unobserved)
+            best = candidates[np.argmax(self.probs[candidates])]
+            return int(self.xs[best]), int(self.ys[best])
+        best = int(np.argmax(self.probs))
+        max_observed = (int(self.xs[best]), int(self.ys[best]))
+        if len(self.observed_positions) < self.size ** 2:
+            # every unobserved location has a probability of 0
+            return self.closest_open(max_observed)
+        return max_observed
+
+    def recommend_sensing_infogain(self, model, colors, top_k=None, memory=2 ** 27):
+        """
+        Recommend where to sense next as in
+        VectorBelief.recommend_sensing_infogain. In sparse mode the
+        candidates are the unobserved positions of the support and the
+        per-distance masses are histograms of the support distances, so
+        the cost scales with the support.
+        :param model: (Model object) sensor model
+        :param colors: (list of strings) all the colors the sensor can detect
+        :param top_k: only evaluate the top_k most likely unobserved
+            positions (None to evaluate all of them)
+        :param memory: bytes available for the arrays of one batch
+        :return: tuple representing the position where we should take
+            the next measurement
+        """
+        if not self.sparse:
+            return super().recommend_sensing_infogain(model, colors, top_k, memory)
+        codes = self.xs * self.size + self.ys
+        observed_codes = np.array([x * self.size + y for x, y in self.observed_positions], dtype=codes.dtype)
+        candidates = np.flatnonzero(~np.isin(codes, observed_codes))
+        if len(candidates) == 0:
+            return self.recommend_sensing()
+        if top_k is not None and top_k < len(candidates):
+            best = np.argpartition(-self.probs[candidates], top_k - 1)[:top_k]
+            candidates = np.sort(candidates[best])
+        likelihoods, llogl = self.entropy_tables(model, colors)
+        plogp = self.probs * np.log(self.probs)  # the support probabilities are positive
+        distances = 2 * self.size - 1
+        support = len(self.probs)
+        # about four candidates x support arrays live at once
+        batch_size = max(1, memory // (8 * 4 * max(support, distances)))
+        entropies = np.empty(len(candidates))
+        for start in range(0, len(candidates), batch_size):
+            batch = candidates[start:start + batch_size]
+            grids = np.abs(self.xs[batch][:, None] - self.xs) + np.abs(self.ys[batch][:, None] - self.ys)
+            index = (grids + (np.arange(len(batch)) * distances)[:, None]).ravel()
+            mass = np.bincount(index, np.tile(self.probs, len(batch)), len(batch) * distances)
+            mass_plogp = np.bincount(index, np.tile(plogp, len(batch)), len(batch) * distances)
+            entropies[start:start + batch_size] = expected_entropy(
+                mass.reshape(len(batch), -1), mass_plogp.reshape(len(batch), -1), likelihoods, llogl)
+        best = candidates[np.argmin(entropies)]
+        return int(self.xs[best]), int(self.ys[best])
+
+
+def simulate_sensing(model, colors, size, policy='greedy', trials=20, top_k=None, seed=None):
+    """
+    Hide the treasure at random positions and count the sensing steps a
+    policy takes to sense at the treasure position.
+    :param model: (Model object) sensor model - the colors are sampled
+        from model.pcolorgivendist
+    :param colors: (list of strings) all the colors the sensor can detect
+    :param size: (int) the number of rows/columns in the grid
+    :param policy: 'greedy' for recommend_sensing or 'infogain' for
+        recommend_sensing_infogain
+    :param top_k: top_k argument of recommend_sensing_infogain
+    :param seed: random seed
+    :return: (average steps to find the treasure, average CPU seconds per
+        sensing decision)
+    """
+    rng = np.random.default_rng(seed)
+    total_steps = 0
+    cpu = 0.0
+    for _ in range(trials):
+        treasure = (int(rng.integers(size)), int(rng.integers(size)))
+        belief = VectorBelief(size)
+        while True:
+            start = time.process_time()
+            if policy == 'infogain':
+                sensor_position = belief.recommend_sensing_infogain(model, colors, top_k)
+            else:
+                sensor_position = belief.recommend_sensing()
+            cpu += time.process_time() - start
+            total_steps += 1
+            if sensor_position == treasure:
+                break
+            distance = utils.manhattan_distance(sensor_position, treasure)
+            probs = np.array([model.pcolorgivendist(color, distance) for color in colors])
+            color = colors[rng.choice(len(colors), p=probs / probs.sum())]
+            belief.update(color, sensor_position, model)
+    return total_steps / trials, cpu / total_steps
+
+
+def benchmark_sensing(model, colors, size, trials=20, top_k=None, seed=0):
+    """
+    Compare the greedy and the information gain sensing policies on the
+    same simulated treasure positions.
+    :return: dictionary - keys are the policies and the values are
+        (average steps to find the treasure, CPU seconds per decision)
+    """
+    results = {}
+    for policy in ('greedy', 'infogain'):
+        results[policy] = simulate_sensing(model, colors, size, policy, trials, top_k, seed)
+        print('%s: steps %.2f cpu/decision %.5fs' % ((policy,) + results[policy]))
+    return results
+
+
+def read_observations(path, chunk_size=1000):
+    """
+    Read a sensor log file in chunks. Each line holds one observation:
+    the color followed by the row and column of the sensor, separated by
+    whitespace. Blank lines and lines starting with # are skipped.
+    :param path: (string) sensor log file
+    :param chunk_size: number of observations per chunk
+    :return: generator of lists of (color, sensor_position) tuples
+    """
+    chunk = []
+    with open(path) as observations:
+        for line in observations:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            color, x, y = fields
+            chunk.append((color, (int(x), int(y))))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def replay(belief, path, model, chunk_size=1000):
+    """
+    Feed a sensor log file through belief.update_many a chunk at a time.
+    :param belief: Belief or VectorBelief object
+    :param path: (string) sensor log file (see read_observations)
+    :param model (Model object) models the relationship between the
+         treasure location and the sensor data
+    :param chunk_size: number of observations per update
+    :return: (int) number of observations replayed
+    """
+    count = 0
+    for chunk in read_observations(path, chunk_size):
+        belief.update_many(chunk, model)
+        count += len(chunk)
+    return count
@@ -0,0 +1,187 @@
+"""
+Bitboard game state for n x n tic-tac-toe
+
+BitboardState can be used in place of GameState by all the search
+functions in adversarial_search.  Square (row, col) is bit row * size + col
+of one integer per agent, wins are tested against precomputed line masks
+and the evaluation function is updated incrementally as moves are made.
+"""
+import functools
+
+
+@functools.lru_cache(maxsize=None)
+def line_masks(size):
+    """
+    Precompute the winning lines of a size x size board.
+    :param size: (int) number of rows/columns
+    :return: a tuple (lines, cell_lines):
+        lines - tuple of the bit masks of all the rows, columns and both
+        diagonals
+        cell_lines - tuple indexed by square containing the masks of the
+        lines going through that square
+    """
+    rows = [sum(1 << (row * size + col) for col in range(size)) for row in range(size)]
+    cols = [sum(1 << (row * size + col) for row in range(size)) for col in range(size)]
+    diagonal = sum(1 << (i * size + i) for i in range(size))
+    anti_diagonal = sum(1 << (i * size + size - 1 - i) for i in range(size))
+    lines = tuple(rows + cols + [diagonal, anti_diagonal])
+    cell_lines = tuple(tuple(mask for mask in lines if mask >> square & 1) for square in range(size * size))
+    return lines, cell_lines
+
+
+class BitboardState(object):
+    """
+    Compact n x n board with make/unmake moves.
+
+    Arguments:
+    size (int): the number of rows/columns in the grid
+    ai (int): bitboard of the squares taken by the AI agent
+    user (int): bitboard of the squares taken by the user
+
+    Attributes:
+    size (int): the number of rows/columns in the grid
+    ai (int): bitboard of the squares taken by the AI agent
+    user (int): bitboard of the squares taken by the user
+    score (int): value of eval() - the number of lines still open for the
+        AI agent minus the number of lines still open for the user
+    winner (string): 'AI', 'user' or None
+    history (list): (bit, agent, score, winner) tuples needed to unmake
+        the moves made on this state
+    """
+    __slots__ = ('size', 'ai', 'user', 'score', 'winner', 'history')
+
+    def __init__(self, size=3, ai=0, user=0):
+        self.size = size
+        self.ai = ai
+        self.user = user
+        self.history = []
+        lines, _ = line_masks(size)
+        # a line is open for an agent if the other agent has no square on it
+        self.score = sum(1 for mask in lines if not user & mask) - sum(1 for mask in lines if not ai & mask)
+        if any(ai & mask == mask for mask in lines):
+            self.winner = 'AI'
+        elif any(user & mask == mask for mask in lines):
+            self.winner = 'user'
+        else:
+            self.winner = None
+
+    @classmethod
+    def from_game_state(cls, game_state, ai_mark='X', user_mark='O'):
+        """
+        Build the bitboard for a GameState.
+        :param game_state: GameState object
+        :param ai_mark: board symbol of the AI agent's squares
+        :param user_mark: board symbol of the user's squares
+        :return: BitboardState object
+        """
+        size = game_state.size
+        ai = user = 0
+        for row in range(size):
+            for col in range(size):
+                if game_state.board[row][col] == ai_mark:
+                    ai |= 1 << (row * size + col)
+                elif game_state.board[row][col] == user_mark:
+                    user |= 1 << (row * size + col)
+        return cls(size, ai, user)
+
+    def copy(self):
+        """
+        :return: BitboardState object with the same position (and an
+            empty history)
+        """
+        state = BitboardState.__new__(BitboardState)
+        state.size = self.size
+        state.ai = self.ai
+        state.user = self.user
+        state.score = self.score
+        state.winner = self.winner
+        state.history = []
+        return state
+
+    def key(self):
+        """
+        :return: hashable key identifying the position
+        """
+        return self.ai, self.user
+
+    def available(self, row, col):
+        return not (self.ai | self.user) >> (row * self.size + col) & 1
+
+    def possible_moves(self):
+        """
+        :return: list of (row, col) tuples of the empty squares, in row order
+        """
+        taken = self.ai | self.user
+        size = self.size
+        return [divmod(square, size) for square in range(size * size) if not taken >> square & 1]
+
+    def make(self, move, agent):
+        """
+        Play a move on this state, updating the evaluation and the winner
+        from the lines going through the square only.
+        :param move: (row, col) tuple of an empty square
+        :param agent: (string) 'user' or 'AI'
+        :return: None
+        """
+        square = move[0] * self.size + move[1]
+        bit = 1 << square
+        self.history.append((bit, agent, self.score, self.winner))
+        _, cell_lines = line_masks(self.size)
+        if agent == 'AI':
+            own = self.ai | bit
+            for mask in cell_lines[square]:
+                if not self.ai & mask:
+                    self.score += 1  # the line is no longer open for the user
+                if own & mask == mask and self.winner is None:
+                    self.winner = 'AI'
+            self.ai = own
+        else:
+            own = self.user | bit
+            for mask in cell_lines[square]:
+                if not self.user & mask:
+                    self.score -= 1  # the line is no longer open for the AI agent
+                if own & mask == mask and self.winner is None:
+                    self.winner = 'user'
+            self.user = own
+
+    def unmake(self):
+        """
+        Take back the last move made on this state.
+        :return: None
+        """
+        bit, agent, self.score, self.winner = self.history.pop()
+        if agent == 'AI':
+            self.ai &= ~bit
+        else:
+            self.user &= ~bit
+
+    def successor(self, move, agent):
+        """
+        :param move: (row, col) tuple of an empty square
+        :param agent: (string) 'user' or 'AI'
+        :return: new BitboardState after the agent plays the move
+        """
+        state = self.copy()
+        state.make(move, agent)
+        return state
+
+    def is_win(self, agent):
+        return self.winner == agent
+
+    def is_tie(self):
+        return self.winner is None and (self.ai | self.user) == (1 << self.size * self.size) - 1
+
+    def eval(self):
+        """
+        :return: (int) number of lines still open for the AI agent minus
+            the number of lines still open for the user
+        """
+        return self.score
+
+    def __str__(self):
+        rows = []
+        for row in range(self.size):
+            rows.append(' '.join('X' if self.ai >> (row * self.size + col) & 1 else
+                                 'O' if self.user >> (row * self.size + col) & 1 else '.'
+                                 for col in range(self.size)))
+        return '\n'.join(rows)
@@ -5,6 +5,16 @@ Your task is to implement two classifiers.
 1.  A multiclass perceptron classifier
 2.  A nearest neighbor classifier
 """
+import heapq
+import itertools
+import json
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import queue
+import threading
+import time
+
 import numpy as np
 # ----------------------------------------------------------------------
 # Question 1: Multiclass perceptron
@@ -20,19 +30,48 @@ class Perceptron(object):
         for digit recognition: (0, 1, 2, 3, 4, 5, 6, 7, 8, 9)
         for Iris: ('Iris-versicolor', 'Iris-virginica', 'Iris-setosa')
     iterations (int):  the number of iterations to be used.
+    average (bool): predict with the average of the weights over all the
+        training steps (averaged perceptron)
+    shuffle (bool): visit the examples in a new random order every epoch
+    seed (int): random seed for the shuffling
+    patience (int): with held out data, stop after this many epochs
+        without an improvement of the held out accuracy
+
+    Training stops early once an epoch makes no mistakes.
 
     Attributes:
     weights (dict): tke keys are labels and the values are the weight
-        vectors corresponding to each label.
+        vectors corresponding to each label (rows of weight_matrix).
+    weight_matrix (numpy array): one row of weights per label, in the
+        order of valid_labels, so all the labels are scored with a
+        single matrix product.
+    label_index (dict): the keys are labels and the values are their row
+        in weight_matrix.
     valid_labels (tuple): the unique labels that will be used.
         for digit recognition: (0, 1, 2, 3, 4, 5, 6, 7, 8, 9)
         for Iris: ('Iris-versicolor', 'Iris-virginica', 'Iris-setosa')
     iterations (int):  the number of iterations to be used.
+    raw_weights (numpy array): the weights being trained (weight_matrix
+        itself unless average is set)
+    accumulated (numpy array): sum of step * update over all the updates,
+        used to compute the averaged weights lazily
+    steps (int): number of examples visited so far
+    epochs (int): number of epochs run by the last training
     """
-    def __init__(self, labels, iterations):
+    def __init__(self, labels, iterations, average=False, shuffle=False, seed=None, patience=1):
         self.weights = {}
+        self.weight_matrix = None
         self.valid_labels = labels
+        self.label_index = {label: i for i, label in enumerate(labels)}
         self.iterations = iterations
+        self.average = average
+        self.shuffle = shuffle
+        self.random = np.random.default_rng(seed)
+        self.patience = patience
+        self.raw_weights = None
+        self.accumulated = None
+        self.steps = 0
+        self.epochs = 0
 
 
     def init_weights(self, num_features):
@@ -42,22 +81,118 @@ class Perceptron(object):
         :param num_features (int): number of features (including bias)
         :return: None
         """
-        for each_label in self.valid_labels:
-            self.weights[each_label] = np.zeros(num_features)
+        self.weight_matrix = np.zeros((len(self.valid_labels), num_features))
+        for i, each_label in enumerate(self.valid_labels):
+            self.weights[each_label] = self.weight_matrix[i]  # view: updated in place
+        if self.average:
+            self.raw_weights = np.zeros_like(self.weight_matrix)
+            self.accumulated = np.zeros_like(self.weight_matrix)
+        else:
+            self.raw_weights = self.weight_matrix
+            self.accumulated = None
+        self.steps = 0
 
 
-    def train(self, data):
+    def train(self, data, verbose=False, held_out=None):
         """
         Train the perceptron with the given labelled data
         :param data (list of Example objects) list of training examples
+        :param verbose (bool): print the iteration number
+        :param held_out (list of Example objects) optional examples used
+            to stop early and keep the weights with the best accuracy
+        :return: None
+        """
+        features = np.array([example.fvector for example in data], dtype=float)
+        labels = [example.label for example in data]
+        if held_out is not None:
+            held_out = (np.array([example.fvector for example in held_out], dtype=float),
+                        [example.label for example in held_out])
+        self.train_arrays(features, labels, verbose, held_out)
+
+    def train_arrays(self, features, labels, verbose=False, held_out=None):
+        """
+        Train the perceptron on a feature matrix
+        :param features (numpy array): one row of features per example
+        :param labels (sequence): the label of each row
+        :param verbose (bool): print the iteration number
+        :param held_out (tuple): optional (features, labels) used to stop
+            early and keep the weights with the best accuracy
         :return: None
         """
-        num_features = data[0].number_of_features
-        self.init_weights(num_features)
+        self.init_weights(features.shape[1])
+        targets = np.array([self.label_index[label] for label in labels])
+        best_accuracy = -1
+        best_state = None
+        stale_epochs = 0
         for iteration in range(1, self.iterations+1):
-            print('iteration:', iteration)
-            for example in data:
-                self.update_weights(example)
+            if verbose:
+                print('iteration:', iteration)
+            order = self.random.permutation(len(targets)) if self.shuffle else range(len(targets))
+            mistakes = self.train_epoch(features, targets, order)
+            self.epochs = iteration
+            if held_out is not None:
+                accuracy = np.mean(np.array(self.predict_batch(held_out[0]), dtype=object) ==
+                                   np.array(held_out[1], dtype=object))
+                if accuracy > best_accuracy:
+                    best_accuracy, best_state, stale_epochs = accuracy, self.training_state(), 0
+                else:
+                    stale_epochs += 1
+            if mistakes == 0 or stale_epochs >= self.patience:
+                break
+        if best_state is not None:
+            self.restore_training_state(best_state)
+
+    def training_state(self):
+        """
+        :return: copy of the weights and the averaging state
+        """
+        return (self.weight_matrix.copy(), self.raw_weights.copy(),
+                None if self.accumulated is None else self.accumulated.copy(), self.steps)
+
+    def restore_training_state(self, state):
+        """
+        Restore (in place) the weights and the averaging state returned
+        by training_state.
+        :param state (tuple): as returned by training_state
+        :return: None
+        """
+        weight_matrix, raw_weights, accumulated, self.steps = state
+        self.weight_matrix[:] = weight_matrix
+        self.raw_weights[:] = raw_weights
+        if accumulated is not None:
+            self.accumulated[:] = accumulated
+
+    def train_epoch(self, features, targets, order=None):
+        """
+        Run one pass of perceptron updates over the examples
+        :param features (numpy array): one row of features per example
+        :param targets (numpy array): the weight_matrix row of each
+            example's label
+        :param order (sequence): order in which to visit the rows
+        :return: (int) number of mistakes
+        """
+        weights = self.raw_weights
+        accumulated = self.accumulated
+        mistakes = 0
+        for i in range(len(targets)) if order is None else order:
+            fvector = features[i]
+            actual = targets[i]
+            predicted = np.argmax(weights @ fvector)
+            if predicted != actual:
+                # in place row updates - no new weight arrays
+                weights[predicted] -= fvector
+                weights[actual] += fvector
+                if accumulated is not None:
+                    # lazy averaging: an update made after c steps is missing
+                    # from the first c weight vectors, so the average after
+                    # n steps is weights - accumulated / n
+                    accumulated[predicted] -= self.steps * fvector
+                    accumulated[actual] += self.steps * fvector
+                mistakes += 1
+            self.steps += 1
+        if accumulated is not None:
+            np.subtract(weights, accumulated / self.steps, out=self.weight_matrix)
+        return mistakes
 
     def update_weights(self, example):
         """
@@ -73,8 +208,8 @@ class Perceptron(object):
             # If wrong: lower score of wrong answer (y), raise score of right answer (y*)
             # wy = wy – f(x)
             # wy* = wy* + f(x)
-            self.weights[predictedLabel] = self.weights[predictedLabel] - example.fvector
-            self.weights[actualLabel] = self.weights[actualLabel] + example.fvector
+            self.weight_matrix[self.label_index[predictedLabel]] -= example.fvector
+            self.weight_matrix[self.label_index[actualLabel]] += example.fvector
         # return NotImplemented
 
     def predict(self, example):
@@ -88,9 +223,317 @@ class Perceptron(object):
         # y = argmaxy wy . f(x)
         # y = label corresponding to the highest score: wy . f(x)
         # return max(self.weights, key=lambda x: np.dot(self.weights[x], example.fvector))
-        return max(self.weights, key=lambda x: self.weights[x] @ example.fvector)
+        # all the scores with one product, the first label wins ties
+        return self.valid_labels[np.argmax(self.weight_matrix @ example.fvector)]
         # return NotImplemented
 
+    def predict_batch(self, features):
+        """
+        Predict the labels of many examples at once
+        :param features (numpy array): one row of features per example
+        :return: list of valid labels
+        """
+        best = np.argmax(features @ self.weight_matrix.T, axis=1)
+        return [self.valid_labels[i] for i in best]
+
+    def train_stream(self, chunk_source, verbose=False, checkpoint=None, checkpoint_every=10, prefetch_chunks=2):
+        """
+        Train the perceptron on a dataset too large for memory, one chunk
+        of (features, labels) arrays at a time, without building Example
+        objects. Only prefetch_chunks chunks are held in memory at once.
+        :param chunk_source (function): called with no arguments at the
+            start of every epoch, returns an iterable of (features, labels)
+            chunks, e.g. lambda: iter_memmap_chunks(features, labels, 10000)
+        :param verbose (bool): print the iteration number
+        :param checkpoint (string): optional .npz file - the training state
+            is saved to it every checkpoint_every chunks and at the end of
+            each epoch, and training resumes from it if it exists
+        :param checkpoint_every (int): chunks between checkpoints
+        :param prefetch_chunks (int): chunks read ahead by a background thread
+        :return: None
+        """
+        start_epoch, start_chunk, start_mistakes = 1, 0, 0
+        if checkpoint is not None and os.path.exists(checkpoint):
+            start_epoch, start_chunk, start_mistakes = self.load_weights(checkpoint)
+        for iteration in range(start_epoch, self.iterations+1):
+            if verbose:
+                print('iteration:', iteration)
+            mistakes = start_mistakes
+            chunks = itertools.islice(chunk_source(), start_chunk, None)
+            stream = prefetch(chunks, prefetch_chunks)
+            try:
+                for index, (features, labels) in enumerate(stream, start_chunk):
+                    if self.weight_matrix is None:
+                        self.init_weights(features.shape[1])
+                    targets = np.array([self.label_index[label] for label in labels.tolist()])
+                    order = self.random.permutation(len(targets)) if self.shuffle else None
+                    mistakes += self.train_epoch(features, targets, order)
+                    if checkpoint is not None and (index + 1) % checkpoint_every == 0:
+                        self.save_weights(checkpoint, iteration, index + 1, mistakes)
+            finally:
+                # stops the read-ahead thread if training fails mid-epoch
+                stream.close()
+            start_chunk = start_mistakes = 0
+            self.epochs = iteration
+            if checkpoint is not None:
+                # a converged run resumes past the last epoch
+                self.save_weights(checkpoint, iteration + 1 if mistakes else self.iterations + 1, 0)
+            if mistakes == 0:
+                break
+
+    def train_parallel(self, features, labels, workers=None, verbose=False):
+        """
+        Train the perceptron with iterative parameter mixing: every epoch
+        each worker process starts from the mixed weights, runs perceptron
+        updates over its shard of the examples, and the mixed weights
+        become the average of the workers' weights.
+        The examples, the mixed weights and the workers' weights live in
+        shared memory, so nothing but shard bounds is sent to the workers.
+        :param features (numpy array): one row of features per example
+        :param labels (sequence): the label of each row
+        :param workers (int): number of worker processes (default: CPU count)
+        :param verbose (bool): print the iteration number
+        :return: None
+        """
+        if self.average:
+            raise ValueError('train_parallel does not support the averaged perceptron')
+        workers = workers or multiprocessing.cpu_count()
+        self.init_weights(features.shape[1])
+        targets = np.array([self.label_index[label] for label in labels])
+        blocks = []
+        try:
+            shared = []
+            for array in (np.asarray(features, dtype=float), targets, self.weight_matrix,
+                          np.zeros((workers,) + self.weight_matrix.shape)):
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                blocks.append(block)
+                np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+                shared.append((block.name, array.shape, array.dtype.str))
+            mixed = np.ndarray(self.weight_matrix.shape, buffer=blocks[2].buf)
+            outputs = np.ndarray((workers,) + self.weight_matrix.shape, buffer=blocks[3].buf)
+            bounds = np.linspace(0, len(targets), workers + 1).astype(int)
+            tasks = [(worker, bounds[worker], bounds[worker + 1]) for worker in range(workers)]
+            with multiprocessing.Pool(workers, init_mixing_worker, (shared,)) as pool:
+                for iteration in range(1, self.iterations+1):
+                    if verbose:
+                        print('iteration:', iteration)
+                    mistakes = sum(pool.map(mixing_worker, tasks))
+                    np.mean(outputs, axis=0, out=mixed)
+                    self.epochs = iteration
+                    if mistakes == 0:
+                        break
+            self.weight_matrix[:] = mixed
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    def save_weights(self, path, epoch=1, chunk=0, mistakes=0):
+        """
+        Save the training state (weights, averaging state, random generator
+        state and position in the data) to a .npz file. The file is
+        replaced atomically.
+        :param path (string): .npz file
+        :param epoch (int): epoch to resume at
+        :param chunk (int): chunk of that epoch to resume at
+        :param mistakes (int): mistakes made in that epoch before chunk
+        :return: None
+        """
+        state = {'weights': self.weight_matrix, 'steps': self.steps, 'epoch': epoch, 'chunk': chunk,
+                 'mistakes': mistakes, 'random': json.dumps(self.random.bit_generator.state)}
+        if self.accumulated is not None:
+            state['raw_weights'] = self.raw_weights
+            state['accumulated'] = self.accumulated
+        temporary = path + '.tmp.npz'
+        np.savez(temporary, **state)
+        os.replace(temporary, path)
+
+    def load_weights(self, path):
+        """
+        Restore the training state saved by save_weights.
+        :param path (string): .npz file
+        :return: (epoch, chunk, mistakes) tuple to resume at - see
+            save_weights
+        """
+        with np.load(path) as state:
+            self.init_weights(state['weights'].shape[1])
+            self.weight_matrix[:] = state['weights']
+            if self.accumulated is not None:
+                self.raw_weights[:] = state['raw_weights']
+                self.accumulated[:] = state['accumulated']
+            self.steps = int(state['steps'])
+            self.random.bit_generator.state = json.loads(str(state['random']))
+            return int(state['epoch']), int(state['chunk']), int(state['mistakes'])
+
+
+# Shared memory arrays of a parallel training run, attached once per worker:
+# (blocks, [features, targets, mixed weights, worker weights])
+mixing_state = None
+
+
+def init_mixing_worker(shared):
+    """
+    Process pool initializer: attach to the shared memory arrays.
+    :param shared (list): (name, shape, dtype) of each shared array
+    :return: None
+    """
+    global mixing_state
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in shared]
+    arrays = [np.ndarray(shape, dtype, buffer=block.buf) for block, (_, shape, dtype) in zip(blocks, shared)]
+    mixing_state = (blocks, arrays)
+
+
+def mixing_worker(task):
+    """
+    Run one epoch of perceptron updates over a shard, starting from the
+    mixed weights, and write the resulting weights to the worker's slot.
+    :param task (tuple): (worker, start, stop) - the shard is rows
+        start to stop
+    :return: (int) number of mistakes
+    """
+    worker, start, stop = task
+    features, targets, mixed, outputs = mixing_state[1]
+    perceptron = Perceptron(range(len(mixed)), 1)
+    perceptron.weight_matrix = perceptron.raw_weights = outputs[worker]
+    outputs[worker] = mixed
+    return perceptron.train_epoch(features[start:stop], targets[start:stop])
+
+
+def benchmark_parallel_training(data, labels, held_out, iterations=10, max_workers=None):
+    """
+    Compare serial training with parallel parameter mixing training on
+    1..max_workers processes: training time and held out accuracy.
+    :param data (list of Example objects) list of training examples
+    :param labels (tuple): the unique labels
+    :param held_out (list of Example objects) examples to measure accuracy
+    :param iterations (int): number of epochs
+    :param max_workers (int): largest number of workers (default: CPU count)
+    :return: dictionary - keys are the number of workers (0 for serial
+        training) and the values are (seconds, accuracy) tuples
+    """
+    features = np.array([example.fvector for example in data], dtype=float)
+    targets = [example.label for example in data]
+    test_features = np.array([example.fvector for example in held_out], dtype=float)
+    test_labels = np.array([example.label for example in held_out], dtype=object)
+    results = {}
+    for workers in range(0, (max_workers or multiprocessing.cpu_count()) + 1):
+        perceptron = Perceptron(labels, iterations)
+        start = time.perf_counter()
+        if workers == 0:
+            perceptron.train_arrays(features, targets)
+        else:
+            perceptron.train_parallel(features, targets, workers)
+        seconds = time.perf_counter() - start
+        accuracy = np.mean(np.array(perceptron.predict_batch(test_features), dtype=object) == test_labels)
+        results[workers] = (seconds, accuracy)
+        print('%s: %.3fs accuracy %.3f' % ('serial' if workers == 0 else 'workers %d' % workers, seconds, accuracy))
+    return results
+
+
+def iter_memmap_chunks(features, labels, chunk_size=10000):
+    """
+    Split a feature matrix and its labels into chunks of rows. Memory
+    mapped arrays (np.load(path, mmap_mode='r')) are only read from disk
+    one chunk at a time.
+    :param features (numpy array): one row of features per example
+    :param labels (numpy array): the label of each row
+    :param chunk_size (int): rows per chunk
+    :return: generator of (features, labels) chunks
+    """
+    for start in range(0, len(labels), chunk_size):
+        yield features[start:start + chunk_size], labels[start:start + chunk_size]
+
+
+def iter_file_chunks(paths):
+    """
+    Read a dataset stored as a sequence of .npz files, each holding a
+    'features' and a 'labels' array.
+    :param paths (list of strings): the chunk files in order
+    :return: generator of (features, labels) chunks
+    """
+    for path in paths:
+        with np.load(path) as chunk:
+            yield chunk['features'], chunk['labels']
+
+
+def prefetch(chunks, depth=2):
+    """
+    Read chunks ahead in a background thread (overlapping disk reads with
+    training) while holding at most depth chunks in memory. Closing the
+    generator early stops the thread and frees the chunks read ahead.
+    :param chunks (iterable): (features, labels) chunks
+    :param depth (int): number of chunks read ahead
+    :return: generator of (features, labels) chunks as float arrays in memory
+    """
+    ready = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        # give up once the consumer has stopped reading
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for features, labels in chunks:
+                if not put((np.array(features, dtype=float), np.asarray(labels))):
+                    return
+        except Exception as error:
+            put(error)
+            return
+        put(done)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = ready.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # stop the producer and free the chunks read ahead
+        stop.set()
+        while producer.is_alive():
+            try:
+                ready.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        producer.join()
+
+
+def benchmark_epoch(data, labels):
+    """
+    Time one training epoch of the weight matrix Perceptron against the
+    original dictionary of weight vectors implementation
+    :param data (list of Example objects) list of training examples
+    :param labels (tuple): the unique labels
+    :return: (examples per second with the dictionary,
+              examples per second with the weight matrix)
+    """
+    weights = {label: np.zeros(data[0].number_of_features) for label in labels}
+    start = time.perf_counter()
+    for example in data:
+        predicted = max(weights, key=lambda x: weights[x] @ example.fvector)
+        if predicted != example.label:
+            weights[predicted] = weights[predicted] - example.fvector
+            weights[example.label] = weights[example.label] + example.fvector
+    dictionary_rate = len(data) / (time.perf_counter() - start)
+    perceptron = Perceptron(labels, 1)
+    start = time.perf_counter()
+    perceptron.train(data)
+    matrix_rate = len(data) / (time.perf_counter() - start)
+    print('dictionary: %.0f examples/sec matrix: %.0f examples/sec' % (dictionary_rate, matrix_rate))
+    return dictionary_rate, matrix_rate
+
 
 # ----------------------------------------------------------------------
 # Question 2: Nearest Neighbor
@@ -120,4 +563,459 @@ def predict_knn(data, example, k):
     # return NotImplemented
 
 
+class KNN(object):
+    """
+    Batch nearest neighbor classifier over a fixed training set.
+    The training features are stacked into one array once. The squared
+    distances from a tile of queries to all the training examples are
+    computed with matrix algebra (|x|^2 - 2 x.t + |t|^2) and argpartition
+    screens out everything but the k nearest (plus anything within
+    rounding error of the k-th). The survivors are ranked with
+    Example.distance, so the results match predict_knn exactly, ties
+    included.
+
+    Arguments:
+    data (list of Example objects): training examples
+    memory (int): bytes available for one tile of query distances
+
+    Attributes:
+    data (list of Example objects): training examples
+    features (numpy array): one row of features per training example
+    squared_norms (numpy array): squared norm of each row of features
+    label_values (list): the distinct labels in order of appearance
+    label_codes (numpy array): index in label_values of each example's label
+    """
+    def __init__(self, data, memory=2 ** 27):
+        self.data = data
+        self.features = np.array([example.fvector for example in data], dtype=float)
+        self.squared_norms = np.einsum('ij,ij->i', self.features, self.features)
+        self.label_values = []
+        codes = {}
+        for example in data:
+            if example.label not in codes:
+                codes[example.label] = len(self.label_values)
+                self.label_values.append(example.label)
+        self.label_codes = np.array([codes[example.label] for example in data])
+        self.tile_rows = max(1, memory // (8 * len(data)))
+
+    def neighbors(self, examples, k):
+        """
+        Find the k nearest training examples of each example
+        :param examples (list of Example objects): examples to classify
+        :param k: number of nearest neighbors
+        :return: list of arrays of training example indices, nearest first
+            (ties in distance in training order, as in predict_knn)
+        """
+        k = min(k, len(self.data))
+        queries = np.array([example.fvector for example in examples], dtype=float)
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+        max_norm = self.squared_norms.max()
+        result = []
+        for start in range(0, len(examples), self.tile_rows):
+            tile = slice(start, start + self.tile_rows)
+            distances = query_norms[tile, None] - 2 * queries[tile] @ self.features.T + self.squared_norms[None, :]
+            kth = np.partition(distances, k - 1, axis=1)[:, k - 1]
+            # bound on the rounding error of the expanded squared distance
+            tolerance = 1e-9 * (query_norms[tile] + max_norm) + 1e-12
+            for row, example in enumerate(examples[tile]):
+                candidates = np.flatnonzero(distances[row] <= kth[row] + 2 * tolerance[row])
+                exact = [example.distance(self.data[i]) for i in candidates]
+                order = np.lexsort((candidates, exact))[:k]
+                result.append(candidates[order])
+        return result
+
+    def vote(self, neighbors):
+        """
+        :param neighbors (array): training example indices, nearest first
+        :return: the label with the highest count, the first one in
+            neighbor order on ties (as max(knn, key=knn.count))
+        """
+        codes = self.label_codes[neighbors]
+        counts = np.bincount(codes, minlength=len(self.label_values))
+        top = counts.max()
+        for code in codes:
+            if counts[code] == top:
+                return self.label_values[code]
+
+    def predict(self, examples, k):
+        """
+        Classify examples based on their nearest neighbors
+        :param examples (list of Example objects): examples to classify
+        :param k: number of nearest neighbors to consider
+        :return: list of labels
+        """
+        return [self.vote(neighbors) for neighbors in self.neighbors(examples, k)]
+
+    def leave_one_out_neighbors(self, rows, k):
+        """
+        Find the k nearest other training examples of training examples
+        :param rows: indices of the training examples
+        :param k: number of nearest neighbors
+        :return: (numpy array) one row of neighbor indices per example,
+            nearest first
+        """
+        examples = [self.data[i] for i in rows]
+        result = np.empty((len(examples), k), dtype=int)
+        for row, (i, neighbors) in enumerate(zip(rows, KNN.neighbors(self, examples, k + 1))):
+            result[row] = neighbors[neighbors != i][:k]
+        return result
+
+    def leave_one_out(self, ks, workers=1):
+        """
+        Leave-one-out accuracy of k-NN for every k in ks, from one sorted
+        neighbor list per training example.
+        The votes of each example are counted incrementally as k grows,
+        keeping the predict_knn tie rule (the label seen first in neighbor
+        order wins).
+        :param ks: the values of k to score
+        :param workers (int): number of processes computing the neighbor
+            lists (None for the CPU count)
+        :return: dictionary - keys are the values of k and the values are
+            the leave-one-out accuracies
+        """
+        ks = sorted(ks)
+        k_max = min(ks[-1], len(self.data) - 1)
+        blocks = [(start, min(start + self.tile_rows, len(self.data)), k_max)
+                  for start in range(0, len(self.data), self.tile_rows)]
+        if workers == 1:
+            neighbors = np.vstack([self.leave_one_out_neighbors(range(start, stop), k) for start, stop, k in blocks])
+        else:
+            with multiprocessing.Pool(workers, init_selection_worker, (self.data,)) as pool:
+                neighbors = np.vstack(pool.map(selection_worker, blocks))
+        codes = self.label_codes[neighbors]
+        correct = np.zeros(k_max + 1, dtype=int)
+        for row, target in zip(codes, self.label_codes):
+            counts = [0] * len(self.label_values)
+            first = {}
+            best, top = None, 0
+            for position, code in enumerate(row.tolist(), 1):
+                counts[code] += 1
+                first.setdefault(code, position)
+                if counts[code] > top or (counts[code] == top and first[code] < first[best]):
+                    best, top = code, counts[code]
+                correct[position] += best == target
+        return {k: correct[min(k, k_max)] / len(self.data) for k in ks}
+
+
+class SpatialIndex(KNN):
+    """
+    Nearest neighbor index over a fixed training set for low dimensional
+    data: a KD-tree (nodes bounded by boxes) or a ball tree (nodes bounded
+    by spheres). Queries visit the nodes nearest first and skip every node
+    that cannot hold one of the k nearest examples.
+    Distances are Euclidean, as in Example.distance; when the training
+    Examples are available the final ranking uses Example.distance itself,
+    so results match predict_knn exactly.
+
+    Arguments:
+    data (list of Example objects): training examples
+    kind (string): 'kd' for a KD-tree or 'ball' for a ball tree
+    leaf_size (int): largest number of examples in a leaf
+
+    Attributes:
+    order (numpy array): training example indices - node n holds
+        order[start[n]:end[n]]
+    start, end (numpy arrays): slice of order held by each node
+    left, right (numpy arrays): children of each node (-1 for leaves)
+    lower, upper (numpy arrays): bounding box of each node ('kd')
+    center, radius (numpy arrays): bounding sphere of each node ('ball')
+    """
+    def __init__(self, data, kind='kd', leaf_size=16):
+        if kind not in ('kd', 'ball'):
+            raise ValueError("kind must be 'kd' or 'ball', got %r" % (kind,))
+        super().__init__(data)
+        self.kind = kind
+        self.leaf_size = leaf_size
+        self.build()
+
+    def build(self):
+        """
+        Build the tree, splitting each node at the median of the feature
+        with the largest spread.
+        :return: None
+        """
+        self.order = np.arange(len(self.features))
+        start, end, left, right, lower, upper, center, radius = [], [], [], [], [], [], [], []
+        stack = [(0, len(self.order), None, None)]  # (start, end, parent, is_right)
+        while stack:
+            first, last, parent, is_right = stack.pop()
+            node = len(start)
+            if parent is not None:
+                (right if is_right else left)[parent] = node
+            points = self.features[self.order[first:last]]
+            start.append(first)
+            end.append(last)
+            left.append(-1)
+            right.append(-1)
+            low, high = points.min(axis=0), points.max(axis=0)
+            lower.append(low)
+            upper.append(high)
+            middle = points.mean(axis=0)
+            center.append(middle)
+            radius.append(np.sqrt(((points - middle) ** 2).sum(axis=1).max()))
+            if last - first > self.leaf_size:
+                dimension = np.argmax(high - low)
+                half = (last - first) // 2
+                split = np.argpartition(points[:, dimension], half)
+                self.order[first:last] = self.order[first:last][split]
+                stack.append((first + half, last, node, True))
+                stack.append((first, first + half, node, False))
+        self.start, self.end = np.array(start), np.array(end)
+        self.left, self.right = np.array(left), np.array(right)
+        self.lower, self.upper = np.array(lower), np.array(upper)
+        self.center, self.radius = np.array(center), np.array(radius)
+
+    def bound(self, node, query):
+        """
+        :return: lower bound of the distance from query to the examples of node
+        """
+        if self.kind == 'ball':
+            return max(0.0, np.sqrt(((query - self.center[node]) ** 2).sum()) - self.radius[node])
+        gap = np.maximum(self.lower[node] - query, 0) + np.maximum(query - self.upper[node], 0)
+        return np.sqrt((gap ** 2).sum())
+
+    def query(self, query, k, example=None):
+        """
+        Find the k nearest training examples of a feature vector
+        :param query (numpy array): feature vector
+        :param k: number of nearest neighbors
+        :param example (Example): the query as an Example, used to rank
+            the final candidates with Example.distance
+        :return: array of training example indices, nearest first (ties
+            in distance in training order, as in predict_knn)
+        """
+        k = min(k, len(self.features))
+        tolerance = 1e-9 * (np.sqrt(query @ query) + np.sqrt(self.squared_norms.max())) + 1e-12
+        best_distances = np.empty(0)
+        best_indices = np.empty(0, dtype=int)
+        visited = []
+        frontier = [(self.bound(0, query), 0)]
+        while frontier:
+            node_bound, node = heapq.heappop(frontier)
+            if len(best_indices) == k and node_bound > best_distances[-1] + tolerance:
+                break  # every remaining node is at least this far
+            if self.left[node] == -1:
+                indices = self.order[self.start[node]:self.end[node]]
+                distances = np.sqrt(((self.features[indices] - query) ** 2).sum(axis=1))
+                visited.append((indices, distances))
+                best_distances = np.concatenate((best_distances, distances))
+                best_indices = np.concatenate((best_indices, indices))
+                best = np.lexsort((best_indices, best_distances))[:k]
+                best_distances, best_indices = best_distances[best], best_indices[best]
+            else:
+                for child in (self.left[node], self.right[node]):
+                    heapq.heappush(frontier, (self.bound(child, query), child))
+        indices = np.concatenate([indices for indices, _ in visited])
+        distances = np.concatenate([distances for _, distances in visited])
+        candidates = distances <= best_distances[-1] + 2 * tolerance
+        indices, distances = indices[candidates], distances[candidates]
+        if example is not None and self.data is not None:
+            distances = [example.distance(self.data[i]) for i in indices]
+        return indices[np.lexsort((indices, distances))][:k]
+
+    def neighbors(self, examples, k):
+        """
+        Find the k nearest training examples of each example
+        :param examples (list of Example objects): examples to classify
+        :param k: number of nearest neighbors
+        :return: list of arrays of training example indices, nearest first
+        """
+        return [self.query(np.asarray(example.fvector, dtype=float), k, example) for example in examples]
+
+    def save(self, path):
+        """
+        Save the index to a .npz file
+        :param path (string): .npz file
+        :return: None
+        """
+        np.savez(path, kind=self.kind, leaf_size=self.leaf_size, tile_rows=self.tile_rows, features=self.features,
+                 label_values=np.array(self.label_values), label_codes=self.label_codes, order=self.order,
+                 start=self.start, end=self.end, left=self.left, right=self.right, lower=self.lower,
+                 upper=self.upper, center=self.center, radius=self.radius)
+
+    @classmethod
+    def load(cls, path, data=None):
+        """
+        Load an index saved with save, without rebuilding the tree
+        :param path (string): .npz file
+        :param data (list of Example objects): optional training examples,
+            for the final ranking with Example.distance
+        :return: SpatialIndex object
+        """
+        index = cls.__new__(cls)
+        with np.load(path) as saved:
+            for name in saved.files:
+                setattr(index, name, saved[name])
+        index.kind = str(index.kind)
+        index.leaf_size = int(index.leaf_size)
+        index.tile_rows = int(index.tile_rows)
+        index.label_values = index.label_values.tolist()
+        index.squared_norms = np.einsum('ij,ij->i', index.features, index.features)
+        index.data = data
+        return index
+
 
+class LSHIndex(KNN):
+    """
+    Approximate nearest neighbor index for high dimensional data, using
+    random projection locality sensitive hashing.
+    Each table hashes an example to the signs of its (centered) features
+    projected on bits random directions, so close examples tend to share a
+    bucket. A query collects the examples in its bucket of every table and
+    ranks them with Example.distance; multi-probing also visits, in every
+    table, the buckets reached by flipping the probes bits whose
+    projections are closest to 0. Queries with fewer than k candidates
+    fall back to the exact search.
+    More tables and probes raise recall, more bits make buckets smaller
+    and queries faster.
+
+    Arguments:
+    data (list of Example objects): training examples
+    tables (int): number of hash tables
+    bits (int): number of projections (hash bits) per table
+    probes (int): number of extra buckets visited per table
+    seed (int): random seed
+
+    Attributes:
+    mean (numpy array): mean feature vector, used to center the data
+    projections (list of numpy arrays): bits x features directions of
+        each table
+    buckets (list of dicts): for each table, the keys are hash codes and
+        the values are arrays of training example indices
+    """
+    def __init__(self, data, tables=8, bits=12, probes=0, seed=None):
+        super().__init__(data)
+        self.probes = probes
+        self.mean = self.features.mean(axis=0)
+        random = np.random.default_rng(seed)
+        powers = 1 << np.arange(bits)
+        self.powers = powers
+        self.projections = []
+        self.buckets = []
+        centered = self.features - self.mean
+        for _ in range(tables):
+            projection = random.standard_normal((bits, self.features.shape[1]))
+            codes = (centered @ projection.T > 0) @ powers
+            order = np.argsort(codes, kind='stable')
+            keys, starts = np.unique(codes[order], return_index=True)
+            self.buckets.append(dict(zip(keys.tolist(), np.split(order, starts[1:]))))
+            self.projections.append(projection)
+
+    def candidates(self, query):
+        """
+        :param query (numpy array): feature vector
+        :return: array of the training example indices sharing a probed
+            bucket with query
+        """
+        found = []
+        centered = query - self.mean
+        for projection, buckets in zip(self.projections, self.buckets):
+            values = projection @ centered
+            code = int((values > 0) @ self.powers)
+            codes = [code] + [code ^ int(self.powers[bit]) for bit in np.argsort(np.abs(values))[:self.probes]]
+            found.extend(buckets[code] for code in codes if code in buckets)
+        if not found:
+            return np.empty(0, dtype=int)
+        return np.unique(np.concatenate(found))
+
+    def neighbors(self, examples, k):
+        """
+        Find (approximately) the k nearest training examples of each example
+        :param examples (list of Example objects): examples to classify
+        :param k: number of nearest neighbors
+        :return: list of arrays of training example indices, nearest first
+        """
+        result = []
+        for example in examples:
+            candidates = self.candidates(np.asarray(example.fvector, dtype=float))
+            if len(candidates) < k:
+                result.extend(super().neighbors([example], k))
+                continue
+            distances = [example.distance(self.data[i]) for i in candidates]
+            result.append(candidates[np.lexsort((candidates, distances))][:k])
+        return result
+
+
+def benchmark_lsh(data, examples, k, settings=((4, 16, 0), (8, 12, 0), (8, 12, 4), (16, 10, 8))):
+    """
+    Compare approximate LSHIndex k-NN with the exact search: queries per
+    second, agreement with the exact predictions and accuracy.
+    :param data: list of training examples
+    :param examples (list of Example objects): labelled test examples
+    :param k: number of nearest neighbors
+    :param settings: (tables, bits, probes) tuples to try
+    :return: dictionary - keys are 'exact' and the settings and the values
+        are (queries per second, agreement, accuracy) tuples
+    """
+    labels = [example.label for example in examples]
+    start = time.perf_counter()
+    exact = KNN(data).predict(examples, k)
+    seconds = time.perf_counter() - start
+    exact_accuracy = np.mean([p == l for p, l in zip(exact, labels)])
+    results = {'exact': (len(examples) / seconds, 1.0, exact_accuracy)}
+    print('exact: %.0f queries/sec accuracy %.3f' % (results['exact'][0], exact_accuracy))
+    for tables, bits, probes in settings:
+        index = LSHIndex(data, tables, bits, probes, seed=0)
+        start = time.perf_counter()
+        predicted = index.predict(examples, k)
+        seconds = time.perf_counter() - start
+        agreement = np.mean([p == e for p, e in zip(predicted, exact)])
+        accuracy = np.mean([p == l for p, l in zip(predicted, labels)])
+        results[(tables, bits, probes)] = (len(examples) / seconds, agreement, accuracy)
+        print('tables %d bits %d probes %d: %.0f queries/sec agreement %.3f accuracy %.3f (loss %.3f)'
+              % (tables, bits, probes, len(examples) / seconds, agreement, accuracy, exact_accuracy - accuracy))
+    return results
+
+
+selection_index = None
+
+
+def init_selection_worker(data):
+    """
+    Process pool initializer: build the worker's KNN over the training set.
+    :param data: list of training examples
+    :return: None
+    """
+    global selection_index
+    selection_index = KNN(data)
+
+
+def selection_worker(task):
+    """
+    :param task (tuple): (start, stop, k) - the rows start to stop of the
+        training set and the number of neighbors
+    :return: (numpy array) leave-one-out neighbors of the rows
+    """
+    start, stop, k = task
+    return selection_index.leave_one_out_neighbors(range(start, stop), k)
+
+
+def select_k(data, ks=range(1, 21), workers=1, verbose=False):
+    """
+    Choose k for predict_knn by leave-one-out cross-validation on the
+    training set, computing the distances once for all the values of k.
+    :param data: list of training examples
+    :param ks: the values of k to try
+    :param workers (int): number of processes (None for the CPU count)
+    :param verbose (bool): print the accuracy of every k
+    :return: (best k, dictionary of the accuracy of every k) tuple - the
+        smallest k on ties
+    """
+    accuracies = KNN(data).leave_one_out(ks, workers)
+    if verbose:
+        for k, accuracy in accuracies.items():
+            print('k = %d: leave-one-out accuracy %.4f' % (k, accuracy))
+    best = max(accuracies, key=lambda k: (accuracies[k], -k))
+    return best, accuracies
+
+
+def predict_knn_batch(data, examples, k):
+    """
+    Classify many examples at once, with the same results as calling
+    predict_knn for each of them
+    :param data: list of training examples
+    :param examples (list of Example objects): examples to classify
+    :param k: number of nearest neighbors to consider
+    :return: list of labels
+    """
+    return KNN(data).predict(examples, k)
@@ -0,0 +1,207 @@
+"""
+Dancing Links (DLX) implementation of Knuth's Algorithm X
+
+An exact cover problem is a set of columns (constraints) and a list of
+rows (choices), each row covering some of the columns.  A solution is a
+set of rows covering every column exactly once.  The matrix is stored as
+circular doubly linked lists in flat arrays, so covering and uncovering a
+column only relinks its neighbours and the search never copies the
+matrix.
+"""
+
+
+class DancingLinks(object):
+    """
+    Exact cover matrix with the Algorithm X search.
+
+    Arguments:
+    columns (int): number of columns
+    rows (list of lists): the columns (0 to columns - 1) covered by each
+        row
+
+    Attributes:
+    left, right, up, down (lists): the links of each node - node 0 is the
+        root, nodes 1 to columns are the column headers and the others are
+        the 1s of the matrix
+    column (list): column header of each node
+    row (list): row index of each node (-1 for the headers)
+    size (list): number of rows left in each column
+    first (list): first node of each row
+    selected (list): rows chosen with select()
+    nodes (int): number of rows tried by the search
+    """
+    def __init__(self, columns, rows):
+        self.left = [columns] + list(range(columns))
+        self.right = list(range(1, columns + 1)) + [0]
+        self.up = list(range(columns + 1))
+        self.down = list(range(columns + 1))
+        self.column = list(range(columns + 1))
+        self.row = [-1] * (columns + 1)
+        self.size = [0] * (columns + 1)
+        self.first = []
+        self.selected = []
+        self.nodes = 0
+        for row in rows:
+            self.add_row(row)
+
+    def add_row(self, columns):
+        """
+        :param columns: (list) the columns covered by the new row
+        :return: (int) index of the new row
+        """
+        first = len(self.left)
+        index = len(self.first)
+        self.first.append(first)
+        for k, j in enumerate(columns):
+            node = first + k
+            header = j + 1
+            self.column.append(header)
+            self.row.append(index)
+            self.left.append(node - 1 if k else first + len(columns) - 1)
+            self.right.append(node + 1 if k < len(columns) - 1 else first)
+            self.up.append(self.up[header])
+            self.down.append(header)
+            self.down[self.up[header]] = node
+            self.up[header] = node
+            self.size[header] += 1
+        return index
+
+    def cover(self, header):
+        """
+        Remove a column and every row covering it from the matrix.
+        :param header: (int) column header node
+        :return: None
+        """
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+        right[left[header]] = right[header]
+        left[right[header]] = left[header]
+        i = down[header]
+        while i != header:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(self, header):
+        """
+        Undo cover(header), the last cover still in effect.
+        :param header: (int) column header node
+        :return: None
+        """
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+        i = up[header]
+        while i != header:
+            j = left[i]
+            while j != i:
+                size[column[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[header]] = header
+        left[right[header]] = header
+
+    def select(self, row):
+        """
+        Put a row in every solution (e.g. the clues of a puzzle), covering
+        its columns.
+        :param row: (int) row index
+        :return: False if one of its columns is already covered (the matrix
+            should then be discarded), otherwise True
+        """
+        node = self.first[row]
+        while True:
+            header = self.column[node]
+            if self.right[self.left[header]] != header:
+                return False
+            self.cover(header)
+            node = self.right[node]
+            if node == self.first[row]:
+                break
+        self.selected.append(row)
+        return True
+
+    def deselect(self):
+        """
+        Undo the last select() still in effect.
+        :return: (int) the row index
+        """
+        row = self.selected.pop()
+        node = self.left[self.first[row]]
+        while True:
+            self.uncover(self.column[node])
+            if node == self.first[row]:
+                break
+            node = self.left[node]
+        return row
+
+    def solutions(self):
+        """
+        Algorithm X: always branch on the column with the fewest rows.
+        The matrix is restored when the generator finishes or is closed.
+        :return: generator of the solutions as sorted lists of row indices
+            (the selected rows included)
+        """
+        right, down, column, size = self.right, self.down, self.column, self.size
+        stack = []  # the node of the row chosen at each level
+        try:
+            while True:
+                if right[0] == 0:
+                    yield sorted(self.selected + [self.row[node] for node in stack])
+                    node = self.backtrack(stack)
+                else:
+                    header = right[0]
+                    j = right[header]
+                    while j != 0:
+                        if size[j] < size[header]:
+                            header = j
+                        j = right[j]
+                    self.cover(header)
+                    node = down[header]
+                while node is not False and node == column[node]:
+                    # every row of the column was tried
+                    self.uncover(node)
+                    node = self.backtrack(stack)
+                if node is False:
+                    return
+                self.nodes += 1
+                stack.append(node)
+                j = right[node]
+                while j != node:
+                    self.cover(column[j])
+                    j = right[j]
+        finally:
+            while stack:
+                self.uncover(column[self.backtrack(stack)])
+
+    def backtrack(self, stack):
+        """
+        Take back the row chosen at the deepest level.
+        :param stack: (list) the node of the row chosen at each level
+        :return: the next node to try at that level (its column header
+            when all the rows were tried), False if the stack is empty
+        """
+        if not stack:
+            return False
+        node = stack.pop()
+        j = self.left[node]
+        while j != node:
+            self.uncover(self.column[j])
+            j = self.left[j]
+        return self.down[node]
+
+    def count(self, limit=None):
+        """
+        :param limit: (int) stop counting at limit solutions (None for no
+            limit)
+        :return: (int) the number of solutions, at most limit
+        """
+        count = 0
+        for _ in self.solutions():
+            count += 1
+            if count == limit:
+                break
+        return count
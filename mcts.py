@@ -0,0 +1,304 @@
+"""
+Monte Carlo Tree Search agent
+
+MCTS is an agent with the same (game_state) -> (row, col) signature as the
+agents in adversarial_search.  It grows a UCT search tree from the current
+state within an iteration or time budget and plays the most visited move.
+Use it on boards where even the depth limited abdl search is too slow.
+"""
+import math
+import random
+import time
+import multiprocessing
+
+import adversarial_search
+
+
+def other_agent(agent):
+    return 'user' if agent == 'AI' else 'AI'
+
+
+def winner(game_state):
+    """
+    :param game_state: GameState object
+    :return: 'AI' or 'user' if that agent has won, 'tie' for a tie and
+        None if the game is not over
+    """
+    if game_state.is_win('user'):
+        return 'user'
+    if game_state.is_tie():
+        return 'tie'
+    if game_state.is_win('AI'):
+        return 'AI'
+    return None
+
+
+class Node(object):
+    """
+    Node of the search tree.
+
+    Attributes:
+    state (GameState): the state of the node
+    agent (string): 'user' or 'AI' - the agent in control of the state
+    move (tuple): the move that led to this node (None for the root)
+    parent (Node): the parent node (None for the root)
+    children (list): the expanded child nodes
+    untried (list): the moves that have not been expanded yet
+    visits (int): number of playouts through this node
+    wins (float): sum of the playout rewards for the agent who made move
+        (1 for a win, 0.5 for a tie, 0 for a loss)
+    """
+    __slots__ = ('state', 'agent', 'move', 'parent', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, state, agent, move=None, parent=None):
+        self.state = state
+        self.agent = agent
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = [] if winner(state) else state.possible_moves()
+        self.visits = 0
+        self.wins = 0.0
+
+    def select_child(self, exploration):
+        """
+        :param exploration: UCT exploration constant
+        :return: the child with the highest upper confidence bound
+        """
+        log_visits = math.log(self.visits)
+        return max(self.children,
+                   key=lambda child: child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits))
+
+
+class MCTS(object):
+    """
+    Monte Carlo Tree Search (UCT) agent for the AI player.
+    Call the object with a GameState to get its move. With more than one
+    worker, use it as a context manager (or call close) to shut down the
+    worker processes.
+
+    Arguments:
+    iterations (int): number of playouts per move (None for no limit)
+    time_limit (float): seconds per move (None for no limit) - at least
+        one of iterations and time_limit must be given. At least one
+        playout is run per move whatever the budget.
+    exploration (float): UCT exploration constant
+    playout (string): 'random' for uniformly random playouts or 'eval'
+        for playouts that greedily pick the move with the best
+        game_state.eval() for the agent in control
+    workers (int): number of processes running independent trees whose
+        root statistics are merged (root parallelization). With more than
+        one worker the tree is not reused between moves.
+    reuse (bool): keep the subtree of the played move for the next call
+    seed (int): random seed
+
+    Attributes:
+    root (Node): the subtree kept for the next call
+    simulated_moves (int): number of moves played in the tree and in the
+        playouts so far
+    """
+
+    def __init__(self, iterations=None, time_limit=1.0, exploration=math.sqrt(2), playout='random', workers=1,
+                 reuse=True, seed=None):
+        if iterations is None and time_limit is None:
+            raise ValueError('MCTS needs an iteration or a time budget')
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.exploration = exploration
+        self.playout = playout
+        self.workers = workers
+        self.reuse = reuse
+        self.random = random.Random(seed)
+        self.root = None
+        self.simulated_moves = 0
+        self.pool = None
+
+    def __call__(self, game_state):
+        """
+        Find the best move for our AI agent.
+        :param game_state: GameState object
+        :return:  a tuple representing the row column of the move
+        """
+        if self.workers > 1:
+            return self.parallel_search(game_state)
+        root = self.find_root(game_state)
+        self.search(root)
+        best = max(root.children, key=lambda child: child.visits)
+        if self.reuse:
+            best.parent = None
+            self.root = best
+        return best.move
+
+    def find_root(self, game_state):
+        """
+        Look for game_state in the subtree kept from the previous move:
+        it is a child of that subtree's root (the user's reply).
+        :param game_state: GameState object
+        :return: Node object for game_state
+        """
+        if self.reuse and self.root is not None:
+            key = adversarial_search.state_key(game_state)
+            for child in self.root.children:
+                if adversarial_search.state_key(child.state) == key:
+                    child.parent = None
+                    return child
+        return Node(game_state, 'AI')
+
+    def search(self, root):
+        """
+        Run playouts from root until the iteration or time budget is spent,
+        and at least one so that the root has a child to play.
+        :param root: Node object
+        :return: None
+        """
+        deadline = None if self.time_limit is None else time.monotonic() + self.time_limit
+        iteration = 0
+        while iteration == 0 or ((self.iterations is None or iteration < self.iterations) and
+                                 (deadline is None or time.monotonic() < deadline)):
+            node = root
+            # selection
+            while not node.untried and node.children:
+                node = node.select_child(self.exploration)
+                self.simulated_moves += 1
+            # expansion
+            if node.untried:
+                move = node.untried.pop(self.random.randrange(len(node.untried)))
+                child = Node(node.state.successor(move, node.agent), other_agent(node.agent), move, node)
+                node.children.append(child)
+                node = child
+                self.simulated_moves += 1
+            # simulation
+            result = self.simulate(node.state, node.agent)
+            # backpropagation
+            while node is not None:
+                node.visits += 1
+                if result == 'tie':
+                    node.wins += 0.5
+                elif result == other_agent(node.agent):
+                    node.wins += 1
+                node = node.parent
+            iteration += 1
+
+    def simulate(self, game_state, agent):
+        """
+        Play the game out from game_state.
+        :param game_state: GameState object
+        :param agent: (string) 'user' or 'AI' - agent in control
+        :return: 'AI', 'user' or 'tie'
+        """
+        result = winner(game_state)
+        if result is not None:
+            return result
+        # play on a private copy with make() when the state supports it
+        state = game_state.copy() if hasattr(game_state, 'make') else game_state
+        while result is None:
+            moves = state.possible_moves()
+            if self.playout == 'eval':
+                sign = 1 if agent == 'AI' else -1
+                move = max(moves, key=lambda m: sign * state.successor(m, agent).eval())
+            else:
+                move = moves[self.random.randrange(len(moves))]
+            if hasattr(state, 'make'):
+                state.make(move, agent)
+            else:
+                state = state.successor(move, agent)
+            self.simulated_moves += 1
+            agent = other_agent(agent)
+            result = winner(state)
+        return result
+
+    def parallel_search(self, game_state):
+        """
+        Grow one tree per worker process from game_state and play the move
+        with the most visits summed over all the trees.
+        :param game_state: GameState object
+        :return:  a tuple representing the row column of the move
+        """
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+        tasks = [(game_state, self.iterations, self.time_limit, self.exploration, self.playout,
+                  self.random.randrange(2 ** 32)) for _ in range(self.workers)]
+        visits = {}
+        for root_visits, simulated_moves in self.pool.map(search_worker, tasks):
+            self.simulated_moves += simulated_moves
+            for move, count in root_visits.items():
+                visits[move] = visits.get(move, 0) + count
+        return max(visits, key=lambda move: visits[move])
+
+    def close(self):
+        """
+        Shut down the worker processes.
+        :return: None
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def search_worker(task):
+    """
+    Grow a tree in a worker process.
+    :param task: (game_state, iterations, time_limit, exploration, playout,
+        seed) tuple
+    :return: (visits, simulated moves) tuple - visits is a dictionary of
+        the root moves and their visit counts
+    """
+    game_state, iterations, time_limit, exploration, playout, seed = task
+    agent = MCTS(iterations, time_limit, exploration, playout, reuse=False, seed=seed)
+    root = Node(game_state, 'AI')
+    agent.search(root)
+    return {child.move: child.visits for child in root.children}, agent.simulated_moves
+
+
+def play(game_state, ai_agent, user_agent):
+    """
+    Play a game with the AI agent moving first.
+    :param game_state: GameState object
+    :param ai_agent: function (game_state) -> (row, col) for the AI agent
+    :param user_agent: function (game_state) -> (row, col) for the user
+    :return: 'AI', 'user' or 'tie'
+    """
+    agents = {'AI': ai_agent, 'user': user_agent}
+    agent = 'AI'
+    while winner(game_state) is None:
+        game_state = game_state.successor(agents[agent](game_state), agent)
+        agent = other_agent(agent)
+    return winner(game_state)
+
+
+def benchmark(game_state, time_limit=1.0, games=10, opponent=adversarial_search.rand, **mcts_options):
+    """
+    Compare MCTS with iterative deepening abdl at the same time per move:
+    both play the AI side of the same number of games against opponent.
+    :param game_state: GameState object - starting position
+    :param time_limit: (float) seconds per move
+    :param games: number of games per agent
+    :param opponent: function (game_state) -> (row, col) for the user
+    :param mcts_options: other MCTS arguments
+    :return: dictionary - keys are 'mcts' and 'abdl' and the values are
+        (win rate, tie rate, simulated moves per second) tuples
+    """
+    results = {}
+    with MCTS(time_limit=time_limit, **mcts_options) as mcts_agent:
+        counter = [0]
+        agents = {'mcts': mcts_agent,
+                  'abdl': lambda state: adversarial_search.abdl_id(adversarial_search.CountingState(state, counter),
+                                                                   time_limit)}
+        for name, agent in agents.items():
+            outcomes = {'AI': 0, 'user': 0, 'tie': 0}
+            start = time.perf_counter()
+            for _ in range(games):
+                mcts_agent.root = None
+                outcomes[play(game_state, agent, opponent)] += 1
+            elapsed = time.perf_counter() - start
+            moves = mcts_agent.simulated_moves if name == 'mcts' else counter[0]
+            results[name] = (outcomes['AI'] / games, outcomes['tie'] / games, moves / elapsed)
+            print('%s: win rate %.2f tie rate %.2f moves/sec %.0f' % ((name,) + results[name]))
+    return results
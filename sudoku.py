@@ -5,12 +5,36 @@ Sudoku puzzle solver implementation
 q1:  Basic Backtracking Search
 q2:  Backtracking Search with AC-3
 q3:  Backtracking Search with MRV Ordering and AC-3
+q4:  Backtracking Search with MRV Ordering and constraint propagation
+     after every assignment (MAC, hidden singles, naked pairs/triples or
+     all-different reasoning)
+
+solve_file solves a file of puzzles (one 81 character line each) across a
+process pool.
+
+solve solves N^2 x N^2 puzzles (9x9, 16x16, 25x25...) with the CSP or with
+the Dancing Links exact cover solver of dlx, and count_solutions checks
+that a puzzle has a unique solution.
+
+q1_bitmask, q2_bitmask and q3_bitmask solve the puzzle in the same way
+with BitmaskSudoku, a specialised engine: the peer tables are computed
+once at import time, domains are 9-bit integers and assignments are
+undone from a trail.
 """
+import functools
+import itertools
+import math
+import multiprocessing
+import random
+import threading
+import time
+
 import csp
+import dlx
 
 
 # Enter your helper functions here
-def createDomain(puzzle):
+def createDomain(puzzle, size=9):
     """
     creates a dictionary representing variables and their domains.
     The dictionary keys are variable names and the values are sets
@@ -18,57 +42,71 @@ def createDomain(puzzle):
     :param puzzle:The dictionary keys are tuples
     (row, column) representing the filled puzzle squares and the values
     are the corresponding numbers assigned to these squares.
+    :param size: number of rows/columns (a square: 4, 9, 16, 25...)
     :return: dictionary of domains at every index
     """
     domain = {}  # create empty dictionary
-    for row in range(9):
-        for column in range(9):  # for every index
+    for row in range(size):
+        for column in range(size):  # for every index
             if (row, column) not in puzzle.keys():  # blank spot in sudoku puzzle
-                domain[(row, column)] = {1, 2, 3, 4, 5, 6, 7, 8, 9}
+                domain[(row, column)] = set(range(1, size + 1))
             else:
                 domain[(row, column)] = {puzzle[(row, column)]}  # value corresponding to index
     return domain
 
 
-def createNeighborSet(row, column):
+def createNeighborSet(row, column, size=9):
     """
     Given an index, returns a set of its neighbors
     :param row: index of row
     :param column: index of column
+    :param size: number of rows/columns (a square: 4, 9, 16, 25...)
     :return: set of neighbors of (row, column)
     """
     setOfNeighbors = set()
-    for i in range(9):
+    for i in range(size):
         if i != row:
             setOfNeighbors.add((i, column))  # adds column neighbors
         if i != column:
             setOfNeighbors.add((row, i))  # adds row neighbors
 
-    # add neighbors in the corresponding 3 by 3 region
-    tbtRow = row // 3
-    tbtColumn = column // 3
-    for j in range(tbtRow * 3, tbtRow * 3 + 3):
-        for k in range(tbtColumn * 3, tbtColumn * 3 + 3):
+    # add neighbors in the corresponding box (3 by 3 for size 9)
+    box = math.isqrt(size)
+    tbtRow = row // box
+    tbtColumn = column // box
+    for j in range(tbtRow * box, tbtRow * box + box):
+        for k in range(tbtColumn * box, tbtColumn * box + box):
             if j != row and k != column:
                 setOfNeighbors.add((j, k))
     return setOfNeighbors
 
 
-def createNeighbors(puzzle):
+def createNeighbors(puzzle, size=9):
     """
     Creates a dictionary representing binary constraints.
     The dictionary keys are variable names and the values are sets
     containing all the variables that are connected to the key.
     (Variables are connected if they both appear in a constraint)
     :param puzzle:
+    :param size: number of rows/columns (a square: 4, 9, 16, 25...)
     :return: dictionary of key(tuple) representing index, and value being
     the set of that index's neighbors
     """
-    neighbors = {}  # create empty dictionary
-    for i in range(9):
-        for j in range(9):
-            neighbors[(i, j)] = createNeighborSet(i, j)
-    return neighbors
+    if size == 9:
+        # copies of the neighbor sets computed at import time
+        return {cell: set(neighbors) for cell, neighbors in NEIGHBORS.items()}
+    return {(i, j): createNeighborSet(i, j, size) for i in range(size) for j in range(size)}
+
+
+CELLS = [(row, column) for row in range(9) for column in range(9)]
+NEIGHBORS = {cell: frozenset(createNeighborSet(*cell)) for cell in CELLS}
+# peers of each cell by index row * 9 + column
+PEERS = tuple(tuple(sorted(row * 9 + column for row, column in NEIGHBORS[cell])) for cell in CELLS)
+# row, column and box of each cell, numbered 0-8, 9-17 and 18-26
+UNITS = tuple((row, 9 + column, 18 + row // 3 * 3 + column // 3) for row, column in CELLS)
+UNIT_CELLS = tuple(tuple(cell for cell in range(81) if unit in UNITS[cell]) for unit in range(27))
+ALL_VALUES = 0x1FF  # bit v - 1 stands for value v
+BIT_COUNT = tuple(bin(domain).count('1') for domain in range(ALL_VALUES + 1))
 
 
 def createConstraints(var1, val1, var2, val2):
@@ -86,16 +124,17 @@ def createConstraints(var1, val1, var2, val2):
     return val1 != val2  # constraint is that neighbors must be alldiff
 
 
-def build_csp(puzzle):
+def build_csp(puzzle, size=9):
     """
     Create a CSP object representing the puzzle.
     :param puzzle (dictionary): The dictionary keys are tuples
     (row, column) representing the filled puzzle squares and the values
     are the corresponding numbers assigned to these squares.
+    :param size: number of rows/columns (a square: 4, 9, 16, 25...)
     :return: CSP object
     """
     # Enter your code here and remove the pass statement below
-    return csp.CSP(createDomain(puzzle), createNeighbors(puzzle), createConstraints)
+    return csp.CSP(createDomain(puzzle, size), createNeighbors(puzzle, size), createConstraints)
 
 
 def q1(puzzle):
@@ -142,3 +181,791 @@ def q3(puzzle):
     q3_csp = build_csp(puzzle)
     q3_csp.ac3_algorithm()
     return q3_csp.backtracking_search("MRV"), q3_csp
+
+
+class SolveTimeout(Exception):
+    """
+    Raised inside BitmaskSudoku.search or propagate when the time budget
+    runs out. Its argument is the number of nodes searched.
+    """
+    pass
+
+
+class BitmaskSudoku(object):
+    """
+    Sudoku solver state with 9-bit integer domains.
+    Assignments and domain reductions are recorded on a trail and undone
+    by popping it back to a mark, so the search never copies domains.
+
+    Arguments:
+    puzzle (dictionary): The dictionary keys are tuples (row, column)
+        representing the filled puzzle squares and the values are the
+        corresponding numbers assigned to these squares.
+
+    Attributes:
+    domains (list): domain of each cell (index row * 9 + column) - bit
+        v - 1 is set if v is in the domain
+    values (list): value assigned to each cell (0 if unassigned)
+    used (list): bits of the values assigned in each unit (see UNITS)
+    trail (list): (cell, domain, assignment) undo records
+    nodes (int): number of assignments made by the search
+    deadline (float): time.monotonic() time at which the search raises
+        SolveTimeout (None for no limit)
+    """
+    def __init__(self, puzzle):
+        self.domains = [ALL_VALUES] * 81
+        for (row, column), value in puzzle.items():
+            self.domains[row * 9 + column] = 1 << (value - 1)
+        self.values = [0] * 81
+        self.used = [0] * 27
+        self.trail = []
+        self.nodes = 0
+        self.deadline = None
+
+    def check_deadline(self):
+        """
+        Raise SolveTimeout if the deadline has passed.
+        :return: None
+        """
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SolveTimeout(self.nodes)
+
+    def remove(self, cell, bits):
+        """
+        :param cell: (int) cell index
+        :param bits: (int) values to remove from the domain
+        :return: (int) the new domain
+        """
+        self.trail.append((cell, self.domains[cell], False))
+        self.domains[cell] &= ~bits
+        return self.domains[cell]
+
+    def assign(self, cell, bit):
+        """
+        :param cell: (int) cell index
+        :param bit: (int) bit of the value to assign
+        :return: None
+        """
+        self.trail.append((cell, self.domains[cell], True))
+        self.domains[cell] = bit
+        self.values[cell] = bit.bit_length()
+        for unit in UNITS[cell]:
+            self.used[unit] |= bit
+
+    def undo(self, mark):
+        """
+        Undo the trail records made after mark.
+        :param mark: (int) length of the trail to return to
+        :return: None
+        """
+        trail = self.trail
+        while len(trail) > mark:
+            cell, domain, assignment = trail.pop()
+            if assignment:
+                bit = 1 << (self.values[cell] - 1)
+                for unit in UNITS[cell]:
+                    self.used[unit] ^= bit
+                self.values[cell] = 0
+            self.domains[cell] = domain
+
+    def consistent(self, cell, bit):
+        """
+        :return: True if no assigned peer of cell has the value of bit
+        """
+        a, b, c = UNITS[cell]
+        return not bit & (self.used[a] | self.used[b] | self.used[c])
+
+    def ac3(self):
+        """
+        Arc consistency for the all-different constraints: a value is only
+        unsupported when a peer's domain is reduced to that value, so the
+        queue holds the cells with a single value left.
+        :return: False if a domain becomes empty, otherwise True
+        """
+        domains = self.domains
+        queue = [cell for cell in range(81) if BIT_COUNT[domains[cell]] == 1]
+        while queue:
+            cell = queue.pop()
+            bit = domains[cell]
+            for peer in PEERS[cell]:
+                if domains[peer] & bit:
+                    domain = self.remove(peer, bit)
+                    if not domain:
+                        return False
+                    if BIT_COUNT[domain] == 1:
+                        queue.append(peer)
+        return True
+
+    def restrict(self, cell, bits, queue, units):
+        """
+        Remove values from the domain of cell and schedule the propagation
+        of the change.
+        :param cell: (int) cell index
+        :param bits: (int) values to remove
+        :param queue: (list) cells reduced to a single value
+        :param units: (set) units whose domains changed
+        :return: False if the domain becomes empty, otherwise True
+        """
+        domain = self.remove(cell, bits)
+        if BIT_COUNT[domain] == 1:
+            queue.append(cell)
+        units.update(UNITS[cell])
+        return domain != 0
+
+    def propagate(self, queue, units, inference='alldiff'):
+        """
+        Remove the values ruled out by the inference rules until nothing
+        changes.
+        :param queue: (list) cells reduced to a single value, whose value
+            is removed from their peers (arc consistency)
+        :param units: (set) units whose domains changed
+        :param inference: (string) rules applied to the changed units as
+            well - 'ac' for none, 'singles' for hidden singles, 'subsets'
+            for hidden singles and naked pairs/triples, 'alldiff' for the
+            all-different propagator
+        :return: False if a domain becomes empty, otherwise True
+        """
+        domains = self.domains
+        while queue or units:
+            self.check_deadline()
+            while queue:
+                cell = queue.pop()
+                bit = domains[cell]
+                for peer in PEERS[cell]:
+                    if domains[peer] & bit and not self.restrict(peer, bit, queue, units):
+                        return False
+            if inference == 'ac':
+                return True
+            if units:
+                cells = UNIT_CELLS[units.pop()]
+                if inference == 'alldiff':
+                    if not self.alldiff(cells, queue, units):
+                        return False
+                elif not self.hidden_singles(cells, queue, units):
+                    return False
+                elif inference == 'subsets' and not self.naked_subsets(cells, queue, units):
+                    return False
+        return True
+
+    def hidden_singles(self, cells, queue, units):
+        """
+        Assign the values that fit in a single cell of the unit.
+        :param cells: (tuple) the cells of the unit
+        :param queue: (list) cells reduced to a single value
+        :param units: (set) units whose domains changed
+        :return: False if the unit cannot be completed, otherwise True
+        """
+        domains = self.domains
+        once = twice = 0
+        for cell in cells:
+            twice |= once & domains[cell]
+            once |= domains[cell]
+        if once != ALL_VALUES:
+            return False  # a value has no cell left
+        hidden = once & ~twice
+        if hidden:
+            for cell in cells:
+                domain = domains[cell]
+                bits = domain & hidden
+                if bits and bits != domain:
+                    if BIT_COUNT[bits] > 1:
+                        return False
+                    self.restrict(cell, domain & ~bits, queue, units)
+        return True
+
+    def naked_subsets(self, cells, queue, units):
+        """
+        Naked pairs and triples: when the domains of 2 (3) cells of the
+        unit hold only 2 (3) values, remove those values from the other
+        cells of the unit.
+        :param cells: (tuple) the cells of the unit
+        :param queue: (list) cells reduced to a single value
+        :param units: (set) units whose domains changed
+        :return: False if a domain becomes empty, otherwise True
+        """
+        domains = self.domains
+        for size in (2, 3):
+            candidates = [cell for cell in cells if 1 < BIT_COUNT[domains[cell]] <= size]
+            for group in itertools.combinations(candidates, size):
+                bits = 0
+                for cell in group:
+                    bits |= domains[cell]
+                if BIT_COUNT[bits] < size:
+                    return False
+                if BIT_COUNT[bits] == size:
+                    for cell in cells:
+                        if cell not in group and domains[cell] & bits and not self.restrict(cell, bits, queue, units):
+                            return False
+        return True
+
+    def alldiff(self, cells, queue, units):
+        """
+        All-different propagator (Regin): find a maximum matching of the
+        cells of the unit to values, then remove every value that is in no
+        maximum matching. A unit has as many cells as values, so the
+        matching is perfect and the value matched to cell j can go to cell
+        i exactly when i and j are in the same strongly connected
+        component of the graph with an edge i -> j when the value matched
+        to j is in the domain of i. This covers hidden singles and naked
+        (and hidden) subsets of every size.
+        :param cells: (tuple) the cells of the unit
+        :param queue: (list) cells reduced to a single value
+        :param units: (set) units whose domains changed
+        :return: False if the unit cannot be completed, otherwise True
+        """
+        domains = self.domains
+        n = len(cells)
+        match_cell = [0] * n  # bit of the value matched to each cell
+        match_value = {}  # cell matched to each value bit
+
+        def augment(i, seen):
+            domain = domains[cells[i]] & ~seen[0]
+            while domain:
+                bit = domain & -domain
+                domain ^= bit
+                seen[0] |= bit
+                j = match_value.get(bit)
+                if j is None or augment(j, seen):
+                    match_value[bit] = i
+                    match_cell[i] = bit
+                    return True
+            return False
+
+        matched = 0
+        for i in range(n):
+            free = domains[cells[i]] & ~matched
+            if free:
+                bit = free & -free
+                matched |= bit
+                match_value[bit] = i
+                match_cell[i] = bit
+        for i in range(n):
+            if not match_cell[i] and not augment(i, [0]):
+                return False
+        # transitive closure of the graph as bit sets of reachable cells
+        reach = []
+        for i in range(n):
+            domain = domains[cells[i]] & ~match_cell[i]
+            cells_reached = 1 << i
+            while domain:
+                bit = domain & -domain
+                domain ^= bit
+                cells_reached |= 1 << match_value[bit]
+            reach.append(cells_reached)
+        for k in range(n):
+            for i in range(n):
+                if reach[i] >> k & 1:
+                    reach[i] |= reach[k]
+        for i in range(n):
+            allowed = 0
+            for j in range(n):
+                if reach[i] >> j & 1 and reach[j] >> i & 1:
+                    allowed |= match_cell[j]
+            extra = domains[cells[i]] & ~allowed
+            if extra:
+                self.restrict(cells[i], extra, queue, units)
+        return True
+
+    def select(self, mrv=False):
+        """
+        :param mrv: (bool) choose the cell with the fewest values left that
+            are consistent with the assignment, the first one otherwise
+        :return: (int) an unassigned cell or None if all are assigned
+        """
+        best = None
+        best_count = 10
+        for cell in range(81):
+            if not self.values[cell]:
+                if not mrv:
+                    return cell
+                a, b, c = UNITS[cell]
+                count = BIT_COUNT[self.domains[cell] & ~(self.used[a] | self.used[b] | self.used[c])]
+                if count < best_count:
+                    best, best_count = cell, count
+                    if count <= 1:
+                        break
+        return best
+
+    def search(self, mrv=False, inference=None):
+        """
+        Backtracking search trying the values in increasing order.
+        :param mrv: (bool) use the MRV ordering
+        :param inference: (string) propagation after every assignment (see
+            propagate), None for none
+        :return: True if the assignment was completed, otherwise False
+        """
+        cell = self.select(mrv)
+        if cell is None:
+            return True
+        domain = self.domains[cell]
+        while domain:
+            bit = domain & -domain
+            domain ^= bit
+            if self.consistent(cell, bit):
+                self.nodes += 1
+                self.check_deadline()
+                mark = len(self.trail)
+                self.assign(cell, bit)
+                if ((inference is None or self.propagate([cell], set(UNITS[cell]), inference)) and
+                        self.search(mrv, inference)):
+                    return True
+                self.undo(mark)
+        return False
+
+    def solution(self):
+        """
+        :return: dictionary of the (row, column) cells and their values
+        """
+        return {cell: value for cell, value in zip(CELLS, self.values)}
+
+
+def q1_bitmask(puzzle):
+    """
+    Solve the given puzzle with basic backtracking search
+    :param puzzle (dictionary): The dictionary keys are tuples
+    (row, column) representing the filled puzzle squares and the values
+    are the corresponding numbers assigned to these squares.
+    :return: a tuple consisting of a solution (dictionary or None) and
+    the BitmaskSudoku object.
+    """
+    engine = BitmaskSudoku(puzzle)
+    return (engine.solution() if engine.search() else None), engine
+
+
+def q2_bitmask(puzzle):
+    """
+    Solve the given puzzle with backtracking search and AC-3 as
+    a preprocessing step.
+    :param puzzle (dictionary): see q1_bitmask
+    :return: a tuple consisting of a solution (dictionary or None) and
+    the BitmaskSudoku object.
+    """
+    engine = BitmaskSudoku(puzzle)
+    solved = engine.ac3() and engine.search()
+    return (engine.solution() if solved else None), engine
+
+
+def q3_bitmask(puzzle):
+    """
+    Solve the given puzzle with backtracking search and MRV ordering and
+    AC-3 as a preprocessing step.
+    :param puzzle (dictionary): see q1_bitmask
+    :return: a tuple consisting of a solution (dictionary or None) and
+    the BitmaskSudoku object.
+    """
+    engine = BitmaskSudoku(puzzle)
+    solved = engine.ac3() and engine.search(mrv=True)
+    return (engine.solution() if solved else None), engine
+
+
+INFERENCES = ('ac', 'singles', 'subsets', 'alldiff')
+
+
+def q4(puzzle, inference='alldiff', time_limit=None):
+    """
+    Solve the given puzzle with backtracking search and MRV ordering,
+    propagating the constraints before the search and after every
+    assignment.
+    :param puzzle (dictionary): see q1_bitmask
+    :param inference: (string) one of INFERENCES - 'ac' maintains arc
+        consistency (MAC), 'singles' adds hidden singles, 'subsets' adds
+        hidden singles and naked pairs/triples and 'alldiff' uses the
+        all-different propagator of each row, column and box
+    :param time_limit: (float) seconds after which the search raises
+        SolveTimeout (None for no limit)
+    :return: a tuple consisting of a solution (dictionary or None) and
+    the BitmaskSudoku object.
+    """
+    engine = BitmaskSudoku(puzzle)
+    if time_limit is not None:
+        engine.deadline = time.monotonic() + time_limit
+    queue = [cell for cell in range(81) if BIT_COUNT[engine.domains[cell]] == 1]
+    solved = engine.propagate(queue, set(range(27)), inference) and engine.search(True, inference)
+    return (engine.solution() if solved else None), engine
+
+
+DIGITS = '123456789ABCDEFGHIJKLMNOP'  # symbols of the values 1 to 25
+
+
+def parse_puzzle(line, size=9):
+    """
+    :param line: (string) the squares in row order - DIGITS for the filled
+        squares and '.' or '0' for the blanks
+    :param size: number of rows/columns (None to infer it from the length
+        of the line)
+    :return: puzzle dictionary as in q1
+    """
+    line = line.strip()
+    if size is None:
+        size = math.isqrt(len(line))
+    if len(line) != size * size or math.isqrt(size) ** 2 != size or size > len(DIGITS):
+        raise ValueError('a %dx%d puzzle has %d squares, got %d' % (size, size, size * size, len(line)))
+    puzzle = {}
+    for i, square in enumerate(line):
+        if square not in '.0':
+            value = DIGITS.find(square.upper()) + 1
+            if not 0 < value <= size:
+                raise ValueError('invalid square %r' % square)
+            puzzle[divmod(i, size)] = value
+    return puzzle
+
+
+# well known hard puzzles
+HARD_PUZZLES = [
+    '1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..',
+    '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..',
+    '1.......2.9.4...5...6...7...5.9.3.......7.......85..4.7.....6...3...9.8...2.....1',
+    '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......',
+    '...7..8......4..3......9..16..5......1..3..4...5..1..75..2..6...3..8..9...7.....2',
+    '........8..3...4...9..2..6.....79.......612...6.5.2.7...8...5...1.....2.4.5.....3',
+    '12.3....435....1....4........54..2..6...7.........8.9...31..5.......9.7.....6...8',
+]
+
+
+def benchmark(puzzles, solvers=((q1, q1_bitmask), (q2, q2_bitmask), (q3, q3_bitmask))):
+    """
+    Compare the CSP solvers with their bitmask equivalents: puzzles solved
+    per second, checking that both find the same solutions.
+    :param puzzles (list of dictionaries): puzzles as in q1
+    :param solvers: (CSP solver, bitmask solver) pairs
+    :return: dictionary - keys are the names of the CSP solvers and the
+        values are (CSP puzzles/sec, bitmask puzzles/sec) tuples
+    """
+    results = {}
+    for solver, bitmask_solver in solvers:
+        rates = []
+        solutions = []
+        for function in (solver, bitmask_solver):
+            start = time.perf_counter()
+            solutions.append([function(puzzle)[0] for puzzle in puzzles])
+            rates.append(len(puzzles) / (time.perf_counter() - start))
+        if solutions[0] != solutions[1]:
+            raise RuntimeError('%s and %s found different solutions' % (solver.__name__, bitmask_solver.__name__))
+        results[solver.__name__] = tuple(rates)
+        print('%s: %.1f puzzles/sec, bitmask %.1f puzzles/sec (%.1fx)'
+              % (solver.__name__, rates[0], rates[1], rates[1] / rates[0]))
+    return results
+
+
+def benchmark_inference(puzzles=HARD_PUZZLES, inferences=INFERENCES):
+    """
+    Compare the inference rules of q4: search nodes and runtime.
+    :param puzzles: list of puzzles as 81 character strings (see
+        parse_puzzle) or dictionaries
+    :param inferences: inference rules to compare
+    :return: dictionary - keys are the inference rules and the values are
+        (total nodes, total seconds, slowest puzzle seconds) tuples
+    """
+    puzzles = [parse_puzzle(puzzle) if isinstance(puzzle, str) else puzzle for puzzle in puzzles]
+    results = {}
+    for inference in inferences:
+        nodes = 0
+        times = []
+        for puzzle in puzzles:
+            start = time.perf_counter()
+            solution, engine = q4(puzzle, inference)
+            times.append(time.perf_counter() - start)
+            nodes += engine.nodes
+        results[inference] = (nodes, sum(times), max(times))
+        print('%s: %d nodes (%.0f per puzzle), %.3f sec (%.1f puzzles/sec), slowest %.3f sec'
+              % (inference, nodes, nodes / len(puzzles), sum(times), len(puzzles) / sum(times), max(times)))
+    return results
+
+
+def format_solution(solution, size=9):
+    """
+    :param solution (dictionary): solution as returned by q1
+    :param size: number of rows/columns
+    :return: (string) the squares in row order (see parse_puzzle)
+    """
+    return ''.join(DIGITS[solution[(row, column)] - 1] for row in range(size) for column in range(size))
+
+
+def read_puzzles(path):
+    """
+    Stream the puzzles of a file, one per line, skipping blank lines and
+    lines starting with '#'.
+    :param path: (string) puzzle file
+    :return: generator of the puzzle lines
+    """
+    with open(path) as puzzle_file:
+        for line in puzzle_file:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+LATENCY_SAMPLE = 100000  # solve times kept by solve_file for the percentiles
+
+
+def solve_worker(task):
+    """
+    Solve one puzzle line in a worker process.
+    :param task: (line, inference, time_limit) tuple - see q4
+    :return: (output, seconds, nodes) tuple - output is the solution as
+        81 characters or 'invalid', 'unsolvable' or 'timeout'
+    """
+    line, inference, time_limit = task
+    start = time.perf_counter()
+    try:
+        solution, engine = q4(parse_puzzle(line), inference, time_limit)
+    except ValueError:
+        return 'invalid', time.perf_counter() - start, 0
+    except SolveTimeout as timeout:
+        return 'timeout', time.perf_counter() - start, timeout.args[0]
+    output = 'unsolvable' if solution is None else format_solution(solution)
+    return output, time.perf_counter() - start, engine.nodes
+
+
+def solve_file(input_path, output_path, workers=None, chunk_size=64, time_limit=None, inference='alldiff',
+               verbose=True):
+    """
+    Solve every puzzle of a file across a process pool, writing one line
+    per puzzle to the output file in input order as the results arrive:
+    the solution, or 'invalid', 'unsolvable' or 'timeout'.
+    The puzzles are read as the workers need them, in tasks of
+    chunk_size lines with at most a few tasks per worker in flight, and the
+    latency percentiles come from a sample of at most LATENCY_SAMPLE solve
+    times, so memory stays bounded on large files.
+    :param input_path: (string) puzzle file, see read_puzzles
+    :param output_path: (string) solution file
+    :param workers: (int) number of processes (None for the CPU count, 1
+        to solve in this process)
+    :param chunk_size: (int) number of puzzles per task
+    :param time_limit: (float) seconds per puzzle (None for no limit)
+    :param inference: (string) inference rules, see q4
+    :param verbose: (bool) print the statistics
+    :return: dictionary of statistics - puzzles, solved, unsolvable,
+        timeout, invalid, seconds, solved_per_sec, p50 and p99 (solve
+        time per puzzle in seconds, estimated from a random sample beyond
+        LATENCY_SAMPLE puzzles) and nodes
+    """
+    workers = workers or multiprocessing.cpu_count()
+    stats = {'puzzles': 0, 'solved': 0, 'unsolvable': 0, 'timeout': 0, 'invalid': 0, 'nodes': 0}
+    latencies = []  # reservoir sample of the solve times
+    sampler = random.Random(0)
+    tasks = ((line, inference, time_limit) for line in read_puzzles(input_path))
+    # the pool reads its task iterator eagerly: each task waits for a slot
+    # in the window, freed when its result is written
+    window = threading.Semaphore(chunk_size * workers * 4)
+    stop = threading.Event()
+
+    def throttled():
+        for task in tasks:
+            while not window.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+            yield task
+
+    start = time.perf_counter()
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        with open(output_path, 'w') as output_file:
+            results = map(solve_worker, tasks) if pool is None else pool.imap(solve_worker, throttled(), chunk_size)
+            for output, seconds, nodes in results:
+                window.release()
+                output_file.write(output + '\n')
+                stats['puzzles'] += 1
+                stats['solved' if len(output) == 81 else output] += 1
+                stats['nodes'] += nodes
+                if len(latencies) < LATENCY_SAMPLE:
+                    latencies.append(seconds)
+                else:
+                    index = sampler.randrange(stats['puzzles'])
+                    if index < LATENCY_SAMPLE:
+                        latencies[index] = seconds
+    finally:
+        stop.set()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    stats['seconds'] = time.perf_counter() - start
+    stats['solved_per_sec'] = stats['solved'] / stats['seconds']
+    latencies.sort()
+    for name, fraction in (('p50', 0.5), ('p99', 0.99)):
+        stats[name] = latencies[int(fraction * (len(latencies) - 1))] if latencies else 0.0
+    if verbose:
+        print('%(puzzles)d puzzles: %(solved)d solved, %(unsolvable)d unsolvable, %(timeout)d timeouts, '
+              '%(invalid)d invalid' % stats)
+        print('%.2f sec, %.1f solved/sec, latency p50 %.2f ms p99 %.2f ms, %d nodes'
+              % (stats['seconds'], stats['solved_per_sec'], 1000 * stats['p50'], 1000 * stats['p99'], stats['nodes']))
+    return stats
+
+
+@functools.lru_cache(maxsize=None)
+def exact_cover_rows(size):
+    """
+    Exact cover model of an empty size x size puzzle: row (row * size +
+    column) * size + value - 1 places value in (row, column) and covers
+    one column of each of the 4 constraints - the square is filled, and
+    the row, the column and the box hold the value.
+    :param size: number of rows/columns (a square: 4, 9, 16, 25...)
+    :return: tuple of the columns covered by each row
+    """
+    box = math.isqrt(size)
+    squares = size * size
+    rows = []
+    for row in range(size):
+        for column in range(size):
+            square = row * size + column
+            box_index = row // box * box + column // box
+            for value in range(size):
+                rows.append((square, squares + row * size + value, 2 * squares + column * size + value,
+                             3 * squares + box_index * size + value))
+    return tuple(rows)
+
+
+def build_dlx(puzzle, size=9):
+    """
+    Create the exact cover matrix of the puzzle, with the rows of the
+    filled squares selected.
+    :param puzzle (dictionary): see q1
+    :param size: number of rows/columns (a square: 4, 9, 16, 25...)
+    :return: DancingLinks object or None if the filled squares conflict
+    """
+    matrix = dlx.DancingLinks(4 * size * size, exact_cover_rows(size))
+    for (row, column), value in sorted(puzzle.items()):
+        if not matrix.select((row * size + column) * size + value - 1):
+            return None
+    return matrix
+
+
+def dlx_solution(rows, size=9):
+    """
+    :param rows: (list) row indices of an exact cover solution
+    :param size: number of rows/columns
+    :return: solution dictionary as in q1
+    """
+    solution = {}
+    for index in rows:
+        square, value = divmod(index, size)
+        solution[divmod(square, size)] = value + 1
+    return solution
+
+
+def solve(puzzle, size=9, method='dlx'):
+    """
+    Solve a size x size puzzle.
+    :param puzzle (dictionary): see q1
+    :param size: number of rows/columns (a square: 4, 9, 16, 25...)
+    :param method: 'csp' for backtracking search with MRV ordering and
+        AC-3 (as q3) or 'dlx' for Dancing Links
+    :return: a tuple consisting of a solution (dictionary or None) and the
+    CSP or DancingLinks object.
+    """
+    if method == 'csp':
+        size_csp = build_csp(puzzle, size)
+        size_csp.ac3_algorithm()
+        return size_csp.backtracking_search("MRV"), size_csp
+    if method != 'dlx':
+        raise ValueError('unknown method %r' % method)
+    matrix = build_dlx(puzzle, size)
+    if matrix is None:
+        return None, matrix
+    rows = next(matrix.solutions(), None)
+    return (None if rows is None else dlx_solution(rows, size)), matrix
+
+
+def count_solutions(puzzle, size=9, limit=2):
+    """
+    Count the solutions of a puzzle with Dancing Links.
+    :param puzzle (dictionary): see q1
+    :param size: number of rows/columns (a square: 4, 9, 16, 25...)
+    :param limit: stop counting at limit solutions (None for no limit) -
+        the default 2 is enough to check that the solution is unique
+    :return: (int) the number of solutions, at most limit
+    """
+    matrix = build_dlx(puzzle, size)
+    return 0 if matrix is None else matrix.count(limit)
+
+
+def generate_puzzle(size=9, blanks=0.5, seed=None, unique=True):
+    """
+    Generate a random puzzle by shuffling the digits, rows and columns of
+    a solved grid and blanking squares in a random order. With unique, a
+    square is only blanked if the puzzle keeps a single solution, so the
+    puzzle can have fewer blanks than asked for.
+    :param size: number of rows/columns (a square: 4, 9, 16, 25...)
+    :param blanks: fraction of the squares to blank
+    :param seed: random seed
+    :param unique: keep the solution unique (checked with count_solutions)
+    :return: puzzle dictionary as in q1
+    """
+    rng = random.Random(seed)
+    box = math.isqrt(size)
+
+    def shuffled_lines():
+        bands = rng.sample(range(box), box)
+        return [band * box + line for band in bands for line in rng.sample(range(box), box)]
+
+    rows = shuffled_lines()
+    columns = shuffled_lines()
+    digits = rng.sample(range(1, size + 1), size)
+    # (box * (row % box) + row // box + column) % size is a valid grid
+    grid = {(i, j): digits[(box * (row % box) + row // box + column) % size]
+            for i, row in enumerate(rows) for j, column in enumerate(columns)}
+    squares = sorted(grid)
+    target = int(blanks * len(squares))
+    order = rng.sample(squares, len(squares))
+    if not unique:
+        for square in order[:target]:
+            del grid[square]
+        return grid
+
+    def row(square):
+        return (square[0] * size + square[1]) * size + grid[square] - 1
+
+    # one matrix for every check: the clues are selected in the reverse
+    # order of the blanking attempts, so the next square to blank is always
+    # under the squares that could not be blanked (kept)
+    matrix = dlx.DancingLinks(4 * size * size, exact_cover_rows(size))
+    for square in reversed(order):
+        matrix.select(row(square))
+    kept = []
+    for square in order:
+        if len(squares) - len(grid) == target:
+            break
+        for _ in range(len(kept) + 1):
+            matrix.deselect()
+        for clue in kept:
+            matrix.select(row(clue))
+        if matrix.count(2) == 1:
+            del grid[square]
+        else:
+            matrix.select(row(square))
+            kept.append(square)
+    return grid
+
+
+def benchmark_sizes(sizes=(9, 16, 25), count=5, blanks=0.5, methods=('dlx',), seed=0):
+    """
+    Solve generated puzzles of each size: puzzles/sec, search nodes and
+    the time to check that the solution is unique. The CSP is only
+    practical for the smallest sizes, add it to methods to compare.
+    :param sizes: numbers of rows/columns
+    :param count: number of puzzles per size
+    :param blanks: fraction of the squares to blank
+    :param methods: methods of solve to compare
+    :param seed: random seed
+    :return: dictionary - keys are (size, method) tuples and the values
+        are (puzzles/sec, nodes per puzzle) tuples - for (size, 'count')
+        (count_solutions with limit=2) they are (puzzles/sec, number of
+        puzzles with a unique solution) tuples
+    """
+    results = {}
+    for size in sizes:
+        puzzles = [generate_puzzle(size, blanks, seed + i) for i in range(count)]
+        for method in methods:
+            nodes = 0
+            start = time.perf_counter()
+            for puzzle in puzzles:
+                solution, solver = solve(puzzle, size, method)
+                nodes += getattr(solver, 'nodes', 0)
+            results[(size, method)] = (count / (time.perf_counter() - start), nodes / count)
+            print('%dx%d %s: %.2f puzzles/sec, %.0f nodes per puzzle' % ((size, size, method) + results[(size, method)]))
+        start = time.perf_counter()
+        unique = sum(count_solutions(puzzle, size) == 1 for puzzle in puzzles)
+        results[(size, 'count')] = (count / (time.perf_counter() - start), unique)
+        print('%dx%d count_solutions: %.2f puzzles/sec, %d of %d unique' % (size, size, results[(size, 'count')][0],
+                                                                            unique, count))
+    return results
@@ -0,0 +1,213 @@
+"""
+Precomputed tablebase of solved positions for small boards
+
+generate() solves every position reachable from the given start positions
+once and writes the minimax values to a .npy file.  Tablebase opens the
+file memory-mapped, so loading is instant and lookups read a few bytes
+from the page cache.  Positions are stored once per class of the 8 board
+symmetries (rotations and reflections).
+
+The file is an open addressing hash table: an array of (key, value)
+records whose size is a power of two.  A position is looked up by probing
+the slots following hash(key) until its key or an empty (key 0) slot is
+found.
+"""
+import numpy as np
+
+import bitboard
+
+RECORD = np.dtype([('key', '<u8'), ('value', 'i1')])
+MULTIPLIER = 0x9E3779B97F4A7C15  # Fibonacci hashing
+MASK64 = (1 << 64) - 1
+
+
+def symmetries(size):
+    """
+    :param size: (int) number of rows/columns
+    :return: list of 8 lists - for each symmetry of the board, the square
+        each square is mapped to
+    """
+    last = size - 1
+    transforms = [lambda r, c: (r, c), lambda r, c: (c, last - r), lambda r, c: (last - r, last - c),
+                  lambda r, c: (last - c, r), lambda r, c: (r, last - c), lambda r, c: (last - r, c),
+                  lambda r, c: (c, r), lambda r, c: (last - c, last - r)]
+    mappings = []
+    for transform in transforms:
+        mapping = []
+        for square in range(size * size):
+            row, col = transform(*divmod(square, size))
+            mapping.append(row * size + col)
+        mappings.append(mapping)
+    return mappings
+
+
+SYMMETRIES = {}
+
+
+def transform(bits, mapping):
+    """
+    :param bits: (int) bitboard
+    :param mapping: list - the square each square is mapped to
+    :return: (int) the transformed bitboard
+    """
+    result = 0
+    while bits:
+        low = bits & -bits
+        result |= 1 << mapping[low.bit_length() - 1]
+        bits ^= low
+    return result
+
+
+def canonical_key(state, agent):
+    """
+    Key shared by all the symmetric versions of a position.
+    :param state: BitboardState object
+    :param agent: (string) 'user' or 'AI' - agent in control
+    :return: (int) non-zero key (the smallest over the 8 symmetries)
+    """
+    size = state.size
+    if size not in SYMMETRIES:
+        SYMMETRIES[size] = symmetries(size)
+    squares = size * size
+    ai, user = state.ai, state.user
+    best = min((transform(ai, mapping) << squares) | transform(user, mapping) for mapping in SYMMETRIES[size])
+    # the top bit keeps every key non-zero (zero marks an empty slot)
+    return (1 << (2 * squares + 1)) | (best << 1) | (agent == 'AI')
+
+
+def slot(key, mask):
+    return ((key * MULTIPLIER) & MASK64) >> 16 & mask
+
+
+def terminal_value(state):
+    """
+    :param state: BitboardState object
+    :return: -1, 0 or 1 as in adversarial_search.value, None if the game
+        is not over
+    """
+    if state.is_win('user'):
+        return -1
+    if state.is_tie():
+        return 0
+    if state.is_win('AI'):
+        return 1
+    return None
+
+
+def solve(state, agent, values):
+    """
+    Solve a position and every position reachable from it, making and
+    unmaking the moves on state.
+    :param state: BitboardState object
+    :param agent: (string) 'user' or 'AI' - agent in control
+    :param values: dictionary of canonical keys and minimax values filled
+        in by the search
+    :return: (int) the minimax value of the position -1, 0 or 1
+    """
+    key = canonical_key(state, agent)
+    v = values.get(key)
+    if v is not None:
+        return v
+    v = terminal_value(state)
+    if v is None:
+        other = 'user' if agent == 'AI' else 'AI'
+        child_values = []
+        for move in state.possible_moves():
+            state.make(move, agent)
+            child_values.append(solve(state, other, values))
+            state.unmake()
+        v = max(child_values) if agent == 'AI' else min(child_values)
+    values[key] = v
+    return v
+
+
+def generate(path, start_states, load_factor=0.5):
+    """
+    Solve every position reachable from the start positions and write the
+    tablebase file.
+    :param path: (string) output .npy file
+    :param start_states: list of (BitboardState, agent) tuples, e.g.
+        [(BitboardState(3), 'AI'), (BitboardState(3), 'user')] for the
+        whole 3x3 game
+    :param load_factor: largest fraction of the slots in use, between 0
+        and 1 (excluded) so the table always has an empty slot
+    :return: (int) number of positions stored
+    """
+    if not 0 < load_factor < 1:
+        raise ValueError('load_factor must be between 0 and 1, got %r' % (load_factor,))
+    values = {}
+    for state, agent in start_states:
+        solve(state.copy(), agent, values)
+    capacity = 1
+    while capacity * load_factor < len(values):
+        capacity *= 2
+    table = np.zeros(capacity, dtype=RECORD)
+    keys = table['key']
+    for key, v in values.items():
+        index = slot(key, capacity - 1)
+        while keys[index]:
+            index = (index + 1) & (capacity - 1)
+        table[index] = (key, v)
+    np.save(path, table)
+    return len(values)
+
+
+class Tablebase(object):
+    """
+    Read only, memory-mapped tablebase written by generate().
+
+    Arguments:
+    path (string): the .npy file written by generate()
+
+    Attributes:
+    table (numpy.memmap): the hash table records
+    """
+
+    def __init__(self, path):
+        self.table = np.load(path, mmap_mode='r')
+        self.mask = len(self.table) - 1
+
+    def value(self, state, agent):
+        """
+        :param state: BitboardState object
+        :param agent: (string) 'user' or 'AI' - agent in control
+        :return: the minimax value of the position -1, 0 or 1 or None if
+            it is not in the tablebase
+        """
+        key = canonical_key(state, agent)
+        index = slot(key, self.mask)
+        # at most one pass over the table, in case a file has no empty slot
+        for _ in range(len(self.table)):
+            record_key, v = self.table[index]
+            if record_key == key:
+                return int(v)
+            if record_key == 0:
+                return None
+            index = (index + 1) & self.mask
+        return None
+
+    def best_move(self, game_state):
+        """
+        Find the best move for our AI agent from the tablebase: the same
+        move as minimax, the first one with the highest value.
+        :param game_state: GameState or BitboardState object
+        :return: a tuple representing the row column of the best move or
+            None if the position is not in the tablebase
+        """
+        if isinstance(game_state, bitboard.BitboardState):
+            state = game_state.copy()
+        else:
+            state = bitboard.BitboardState.from_game_state(game_state)
+        best_move = None
+        best_value = None
+        for move in state.possible_moves():
+            state.make(move, 'AI')
+            v = terminal_value(state)
+            if v is None:
+                v = self.value(state, 'user')
+            state.unmake()
+            if v is None:
+                return None
+            if best_value is None or v > best_value:
+                best_move, best_value = move, v
+        return best_move
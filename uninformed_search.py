@@ -4,58 +4,139 @@ Uninformed Search Algorithm implementation
 
 dfs has been implemented for you.
 Your task for homework 3 is to implement bfs and ucs.
+
+With dedup=True, dfs and bfs skip the states already reached when the
+children are generated, so every state is pushed on the fringe at most
+once, and bfs tests for the goal when a child is generated.
+compare_dedup reports the peak fringe size and memory of both modes.
 """
+import time
+import tracemalloc
+
 import data_structures
 
-def dfs(problem):
+def dfs(problem, dedup=False, stats=None):
     """
     Depth first graph search algorithm - implemented for you
     :param problem (a Problem object) representing the quest
             see Problem class definition in spartanquest.py)
+    :param dedup (bool) skip the children already reached (expanded or on
+            the fringe) when they are generated - a state then keeps the
+            first path that reached it, so the solution may differ
+    :param stats (dictionary) if given, filled with the numbers of
+            'expanded' and 'generated' nodes and the 'peak_fringe' size
     :return: list of actions representing the solution to the quest
                 or None if there is no solution
     """
-    closed = set()  # keep track of our explored states
+    stats = {} if stats is None else stats
+    stats.update(expanded=0, generated=0, peak_fringe=1)
+    closed = set()  # keep track of our explored states (reached states with dedup)
     fringe = data_structures.Stack() # for dfs, the fringe is a stack
     state = problem.start_state()
     root = data_structures.Node(state, None, None)
     fringe.push(root)
+    size = 1  # number of nodes on the fringe
+    if dedup:
+        closed.add(state)
     while not fringe.is_empty():
         node = fringe.pop()
+        size -= 1
         if problem.is_goal(node.state):
             return node.solution()  # we found a solution
-        if node.state not in closed:  # we are implementing graph search
+        if dedup or node.state not in closed:  # we are implementing graph search
             closed.add(node.state)
+            stats['expanded'] += 1
             for child_state, action, action_cost in problem.expand(node.state):
+                if dedup:
+                    if child_state in closed:
+                        continue
+                    closed.add(child_state)
                 child_node = data_structures.Node(child_state, node, action)
                 fringe.push(child_node)
+                size += 1
+                stats['generated'] += 1
+            stats['peak_fringe'] = max(stats['peak_fringe'], size)
     return None  # Failure -  no solution was found
 
-def bfs(problem):
+def bfs(problem, dedup=False, stats=None):
     """
     Breadth first graph search algorithm
     :param problem (a Problem object) representing the quest
             see Problem class definition in spartanquest.py)
+    :param dedup (bool) skip the children already reached (expanded or on
+            the fringe) and test for the goal when they are generated,
+            which saves expanding the last layer - the solution is
+            still a shortest one
+    :param stats (dictionary) if given, filled with the numbers of
+            'expanded' and 'generated' nodes and the 'peak_fringe' size
     :return: list of actions representing the solution to the quest
             or None if there is no solution
     """
     # Enter your  code here and remove the pass statement below
-    closed = set()  # keep track of our explored states
+    stats = {} if stats is None else stats
+    stats.update(expanded=0, generated=0, peak_fringe=1)
+    closed = set()  # keep track of our explored states (reached states with dedup)
     fringe = data_structures.Queue()  # bfs, using Queue for the fringe
     state = problem.start_state()
     root = data_structures.Node(state, None, None)
     fringe.push(root)
+    size = 1  # number of nodes on the fringe
+    if dedup:
+        if problem.is_goal(state):
+            return root.solution()
+        closed.add(state)
     while not fringe.is_empty():
         node = fringe.pop()
-        if problem.is_goal(node.state):
+        size -= 1
+        if not dedup and problem.is_goal(node.state):
             return node.solution()  # we found a solution
-        if node.state not in closed:  # we are implementing graph search
+        if dedup or node.state not in closed:  # we are implementing graph search
             closed.add(node.state)
+            stats['expanded'] += 1
             for child_state, action, action_cost in problem.expand(node.state):
+                if dedup and child_state in closed:
+                    continue
                 child_node = data_structures.Node(child_state, node, action)
+                stats['generated'] += 1
+                if dedup:
+                    if problem.is_goal(child_state):
+                        return child_node.solution()  # goal test at generation time
+                    closed.add(child_state)
                 fringe.push(child_node)
+                size += 1
+            stats['peak_fringe'] = max(stats['peak_fringe'], size)
     return None  # Failure -  fringe is empty and no solution was found
 
+def compare_dedup(problem, searches=(dfs, bfs)):
+    """
+    Run the searches with and without dedup and compare them: run time,
+    solution length, nodes expanded and generated, peak fringe size and
+    peak memory allocated (measured with tracemalloc in a second run, so
+    it does not slow down the timed one)
+    :param problem (a Problem object) representing the quest
+    :param searches: search functions with the dedup and stats arguments
+    :return: dictionary - keys are (function name, dedup) tuples and the
+            values are the stats dictionaries with 'seconds', 'length' and
+            'memory' (bytes) added
+    """
+    results = {}
+    for search in searches:
+        for dedup in (False, True):
+            stats = {}
+            start = time.perf_counter()
+            solution = search(problem, dedup, stats)
+            stats['seconds'] = time.perf_counter() - start
+            stats['length'] = None if solution is None else len(solution)
+            tracemalloc.start()
+            search(problem, dedup)
+            stats['memory'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[(search.__name__, dedup)] = stats
+            print('%s dedup=%s: %.3f sec, length %s, %d expanded, %d generated, peak fringe %d, peak memory %.1f MB'
+                  % (search.__name__, dedup, stats['seconds'], stats['length'], stats['expanded'],
+                     stats['generated'], stats['peak_fringe'], stats['memory'] / 2 ** 20))
+    return results
+
 """
 Note from grading rubric:
 ucs efficiency